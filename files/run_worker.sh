@@ -9,4 +9,40 @@ chmod 0700 "${PACKIT_HOME}/.ssh"
 
 grep -q gitlab.com "${PACKIT_HOME}/.ssh/known_hosts" || ssh-keyscan gitlab.com >>"${PACKIT_HOME}/.ssh/known_hosts"
 
+# Workers can be deployed per cost class of the handler tasks
+# (see TaskCost in hardly/handlers/abstract.py) with differently sized pools:
+# many cheap status relays can run at once, but just a few heavy syncs.
+case "${WORKER_COST_CLASS}" in
+light)
+    : "${QUEUES:=short-running}"
+    : "${CONCURRENCY:=${LIGHT_CONCURRENCY:-8}}"
+    ;;
+heavy)
+    : "${QUEUES:=long-running}"
+    : "${CONCURRENCY:=${HEAVY_CONCURRENCY:-1}}"
+    ;;
+esac
+export QUEUES CONCURRENCY
+
+# Repo-affinity routing of heavy tasks (see hardly/routing.py):
+# each worker (StatefulSet pod) serving them consumes also the AFFINITY_QUEUES
+# whose index modulo WORKER_REPLICAS (the number of the pods) is the pod's ordinal,
+# so that every queue has a consumer even when there are fewer pods than queues.
+# Changing WORKER_REPLICAS reshuffles the queues among all the pods, it has
+# to be the same on all of them, i.e. scaling needs a rollout of all the pods.
+if [[ -n "${AFFINITY_QUEUES}" && "${WORKER_COST_CLASS}" != "light" ]]; then
+    IFS=',' read -ra affinity_queues <<<"${AFFINITY_QUEUES}"
+    replicas="${WORKER_REPLICAS:-${#affinity_queues[@]}}"
+    ordinal="${HOSTNAME##*-}"
+    if [[ "${ordinal}" =~ ^[0-9]+$ && "${replicas}" =~ ^[1-9][0-9]*$ ]]; then
+        QUEUES="${QUEUES:-short-running,long-running}"
+        for i in "${!affinity_queues[@]}"; do
+            if ((i % replicas == ordinal)); then
+                QUEUES="${QUEUES},${affinity_queues[i]// /}"
+            fi
+        done
+        export QUEUES
+    fi
+fi
+
 exec run_worker_.sh
@@ -0,0 +1,263 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""Caches of data fetched from git-forges."""
+
+import json
+from collections import OrderedDict
+from copy import deepcopy
+from logging import getLogger
+from os import getenv
+from typing import Any, Hashable, Optional, Tuple
+
+from hardly.constants import (
+    BRANCHES_CACHE_TTL,
+    MISSING_PROJECTS_CACHE_TTL,
+    MR_MAPPING_CACHE_TTL,
+    PACKAGE_CONFIG_CACHE_SIZE,
+    PACKAGE_CONFIG_CACHE_TTL,
+)
+from hardly.store import VersionedState, get_redis, make_key
+from ogr.abstract import GitProject
+from packit.config.package_config import PackageConfig
+from packit_service.utils import dump_package_config, load_package_config
+
+logger = getLogger(__name__)
+
+
+def normalize_project_url(url: str) -> str:
+    return url.rstrip("/").removesuffix(".git")
+
+
+def get_project_url(project: GitProject) -> str:
+    """Project URL which (unlike GitProject.get_web_url()) needs no API call."""
+    return f"{project.service.instance_url}/{project.namespace}/{project.repo}"
+
+
+class LRUCache:
+    """Worker-local mapping keeping only the maxsize most recently used items."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._items: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        if key not in self._items:
+            return default
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def set(self, key: Hashable, value: Any):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxsize:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class BranchesCache:
+    """
+    Branches of git projects, shared by all the workers.
+
+    The branches expire after BRANCHES_CACHE_TTL seconds
+    or when a push event creates/deletes a branch.
+    """
+
+    # Marks a cached (possibly empty) set, it's not a valid branch name.
+    SENTINEL = ""
+
+    @staticmethod
+    def _key(project_url: str) -> str:
+        return make_key("branches", normalize_project_url(project_url))
+
+    @classmethod
+    def branch_exists(cls, project: GitProject, branch: str) -> bool:
+        key = cls._key(get_project_url(project))
+        with get_redis().pipeline() as pipe:
+            pipe.exists(key)
+            pipe.sismember(key, branch)
+            cached, exists = pipe.execute()
+        if cached:
+            return bool(exists)
+
+        branches = project.get_branches()
+        ttl = int(getenv("BRANCHES_CACHE_TTL", BRANCHES_CACHE_TTL))
+        with get_redis().pipeline() as pipe:
+            pipe.sadd(key, cls.SENTINEL, *branches)
+            pipe.expire(key, ttl)
+            pipe.execute()
+        return branch in branches
+
+    @classmethod
+    def invalidate(cls, project_url: str):
+        logger.debug(f"Invalidating cached branches of {project_url}")
+        get_redis().delete(cls._key(project_url))
+
+    @classmethod
+    def update_on_push(cls, project_url: str, branch: str):
+        """Invalidate the branches of the project if the push created a branch."""
+        if not get_redis().sismember(cls._key(project_url), branch):
+            cls.invalidate(project_url)
+
+
+class MissingProjectsCache:
+    """
+    Projects known not to exist, e.g. source-git repos of most dist-git repos.
+
+    Saves the API calls for each event of such a (dist-git) project.
+    The entries expire after MISSING_PROJECTS_CACHE_TTL seconds,
+    refresh() them sooner when a project has been created.
+    """
+
+    @staticmethod
+    def _key(project_url: str) -> str:
+        return make_key("missing-project", normalize_project_url(project_url))
+
+    @classmethod
+    def is_missing(cls, project_url: str) -> bool:
+        if missing := bool(get_redis().exists(cls._key(project_url))):
+            logger.debug(f"{project_url} is known not to exist")
+        return missing
+
+    @classmethod
+    def mark_missing(cls, project_url: str):
+        ttl = int(getenv("MISSING_PROJECTS_CACHE_TTL", MISSING_PROJECTS_CACHE_TTL))
+        get_redis().set(cls._key(project_url), 1, ex=ttl)
+
+    @classmethod
+    def refresh(cls, project_url: Optional[str] = None) -> int:
+        """
+        Forget that a project doesn't exist.
+
+        Args:
+            project_url: URL of the project, all of them if not set.
+
+        Returns:
+            Number of forgotten projects.
+        """
+        redis = get_redis()
+        if project_url:
+            return redis.delete(cls._key(project_url))
+        keys = list(redis.scan_iter(match=make_key("missing-project", "*")))
+        return redis.delete(*keys) if keys else 0
+
+
+class PackageConfigCache:
+    """
+    Parsed package configs, addressed by the project and the commit they're loaded from.
+
+    A config can't change for the same commit, so the entries never need
+    to be invalidated. They're kept in the worker's memory and, if
+    PACKAGE_CONFIG_CACHE_SHARED is set, also in Redis for the other workers.
+    """
+
+    _local = LRUCache(maxsize=PACKAGE_CONFIG_CACHE_SIZE)
+
+    @staticmethod
+    def _shared() -> bool:
+        return bool(getenv("PACKAGE_CONFIG_CACHE_SHARED"))
+
+    @staticmethod
+    def _key(project_url: str, commit_sha: str) -> str:
+        return make_key(
+            "package-config", normalize_project_url(project_url), commit_sha
+        )
+
+    @classmethod
+    def get(cls, project_url: str, commit_sha: str) -> Optional[PackageConfig]:
+        key = cls._key(project_url, commit_sha)
+        if (package_config := cls._local.get(key)) is None and cls._shared():
+            if raw := get_redis().get(key):
+                package_config = load_package_config(json.loads(raw))
+                cls._local.set(key, package_config)
+        # the handlers are free to modify their package config
+        return deepcopy(package_config)
+
+    @classmethod
+    def set(cls, project_url: str, commit_sha: str, package_config: PackageConfig):
+        key = cls._key(project_url, commit_sha)
+        cls._local.set(key, deepcopy(package_config))
+        if cls._shared():
+            ttl = int(getenv("PACKAGE_CONFIG_CACHE_TTL", PACKAGE_CONFIG_CACHE_TTL))
+            get_redis().set(
+                key, json.dumps(dump_package_config(package_config)), ex=ttl
+            )
+
+
+class MRMappingCache:
+    """
+    Write-through cache of the source-git MR <-> dist-git MR links (stored in the DB).
+
+    Each direction is a key of its own, holding the [project URL, MR ID]
+    of the other side. Only the existing links are cached, a link can be
+    created any time and its first CI statuses must not be lost.
+    Along with the links, the head commits of the source-git MRs are kept.
+    """
+
+    @staticmethod
+    def _key(side: str, project_url: str, pr_id: int) -> str:
+        return make_key("mr-map", side, normalize_project_url(project_url), str(pr_id))
+
+    @classmethod
+    def _get(cls, side: str, project_url: str, pr_id: int) -> Optional[Tuple[str, int]]:
+        if not (cached := get_redis().get(cls._key(side, project_url, pr_id))):
+            return None
+        counterpart_url, counterpart_id = json.loads(cached)
+        return counterpart_url, counterpart_id
+
+    @classmethod
+    def get_source_git_pr(
+        cls, dist_git_project_url: str, dist_git_pr_id: int
+    ) -> Optional[Tuple[str, int]]:
+        """[Project URL, MR ID] of the source-git MR, None if it's not cached."""
+        return cls._get("dist-git", dist_git_project_url, dist_git_pr_id)
+
+    @classmethod
+    def get_dist_git_pr(
+        cls, source_git_project_url: str, source_git_pr_id: int
+    ) -> Optional[Tuple[str, int]]:
+        """[Project URL, MR ID] of the dist-git MR, None if it's not cached."""
+        return cls._get("source-git", source_git_project_url, source_git_pr_id)
+
+    @classmethod
+    def set(
+        cls,
+        source_git: Tuple[str, int],
+        dist_git: Tuple[str, int],
+    ):
+        """Cache the link of the source_git & dist_git (project URL, MR ID) pairs."""
+        ttl = int(getenv("MR_MAPPING_CACHE_TTL", MR_MAPPING_CACHE_TTL))
+        with get_redis().pipeline() as pipe:
+            pipe.set(cls._key("source-git", *source_git), json.dumps(dist_git), ex=ttl)
+            pipe.set(cls._key("dist-git", *dist_git), json.dumps(source_git), ex=ttl)
+            pipe.execute()
+
+    @staticmethod
+    def _head_commit(project_url: str, pr_id: int) -> VersionedState:
+        ttl = int(getenv("MR_MAPPING_CACHE_TTL", MR_MAPPING_CACHE_TTL))
+        return VersionedState(
+            "mr-head", normalize_project_url(project_url), str(pr_id), ttl=ttl
+        )
+
+    @classmethod
+    def set_head_commit(
+        cls, project_url: str, pr_id: int, commit_sha: str, timestamp: int
+    ) -> bool:
+        """
+        Record the head commit of a source-git MR, unless there's a newer one.
+
+        Args:
+            timestamp: When the event with the commit was received.
+        """
+        return cls._head_commit(project_url, pr_id).set_if_newer(
+            (timestamp, 0), commit_sha
+        )
+
+    @classmethod
+    def get_head_commit(cls, project_url: str, pr_id: int) -> Optional[str]:
+        return cls._head_commit(project_url, pr_id).get()
@@ -0,0 +1,192 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Circuit breakers of the git-forge hosts, shared by all the workers.
+
+When too many tasks of a host fail because of transient errors, the breaker
+trips (opens) and the tasks of that host are deferred for a while
+instead of being run, so that the degraded forge is not hammered.
+Once the while passes, the breaker is half-open and lets a single probe
+task through, its result either closes the breaker or opens it again.
+The tasks of the other hosts are not affected at all.
+
+A task is let through by the breaker of its event's host, but its failure
+is charged to the host that actually failed, e.g. the source-git forge
+the status of a dist-git pipeline is reported to.
+"""
+
+import random
+from enum import Enum
+from logging import getLogger
+from os import getenv
+from time import time
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+from git import GitCommandError
+
+from hardly.constants import (
+    CIRCUIT_BREAKER_ERROR_RATE,
+    CIRCUIT_BREAKER_MIN_CALLS,
+    CIRCUIT_BREAKER_OPEN_TIME,
+    CIRCUIT_BREAKER_WINDOW,
+)
+from hardly.store import get_redis, make_key
+
+logger = getLogger(__name__)
+
+# Seconds after which another probe is let through if the result
+# of the previous one hasn't been recorded (e.g. the worker has been killed).
+PROBE_TTL = 10 * 60
+# Seconds after which a tripped breaker is closed in any case.
+TRIPPED_TTL = 24 * 60 * 60
+
+
+# Host of the last failed response (server error or rate limit) of the task
+# the worker process runs, see observe_response()
+_last_failed_host: Optional[str] = None
+
+
+def observe_response(response: requests.Response, *args, **kwargs):
+    """Response hook remembering the host of the last failed forge response."""
+    global _last_failed_host
+    if response.status_code == 429 or response.status_code >= 500:
+        _last_failed_host = urlparse(response.url).hostname
+
+
+def forget_failed_responses():
+    """Forget the failed responses of the previous task."""
+    global _last_failed_host
+    _last_failed_host = None
+
+
+def _get_url_host(url) -> Optional[str]:
+    return urlparse(url).hostname if isinstance(url, str) and "://" in url else None
+
+
+def get_failing_host(ex: BaseException) -> Optional[str]:
+    """
+    Host the task failed to communicate with.
+
+    The request of the error (or of the errors it has been raised from)
+    is preferred, the forges' API errors don't carry it, though,
+    so then it's the host of the last failed response.
+    """
+    seen = set()
+    while ex is not None and id(ex) not in seen:
+        seen.add(id(ex))
+        for attr in ("request", "response"):
+            if host := _get_url_host(getattr(getattr(ex, attr, None), "url", None)):
+                return host
+        if isinstance(ex, GitCommandError):
+            for arg in ex.command if isinstance(ex.command, list) else []:
+                if host := _get_url_host(arg):
+                    return host
+        ex = ex.__cause__ or ex.__context__
+    return _last_failed_host
+
+
+class Permit(str, Enum):
+    denied = "denied"
+    allowed = "allowed"
+    # allowed as the probe of a half-open breaker
+    probe = "probe"
+
+
+class CircuitBreaker:
+    def __init__(self, host: str):
+        self.host = host
+        self.error_rate = float(
+            getenv("CIRCUIT_BREAKER_ERROR_RATE", CIRCUIT_BREAKER_ERROR_RATE)
+        )
+        self.min_calls = int(
+            getenv("CIRCUIT_BREAKER_MIN_CALLS", CIRCUIT_BREAKER_MIN_CALLS)
+        )
+        self.window = int(getenv("CIRCUIT_BREAKER_WINDOW", CIRCUIT_BREAKER_WINDOW))
+        self.open_time = int(
+            getenv("CIRCUIT_BREAKER_OPEN_TIME", CIRCUIT_BREAKER_OPEN_TIME)
+        )
+
+    @classmethod
+    def for_event(cls, event: Optional[dict]) -> Optional["CircuitBreaker"]:
+        """Breaker of the host of the project the event is for."""
+        if not (event and (project_url := event.get("project_url"))):
+            return None
+        if not (host := urlparse(project_url).hostname):
+            return None
+        return cls(host)
+
+    def _key(self, *parts) -> str:
+        return make_key("circuit-breaker", self.host, *parts)
+
+    def allow(self) -> Permit:
+        """Tell whether a task can be run now."""
+        with get_redis().pipeline() as pipe:
+            pipe.exists(self._key("tripped"))
+            pipe.exists(self._key("open"))
+            tripped, is_open = pipe.execute()
+        if not tripped:
+            return Permit.allowed
+        if is_open:
+            return Permit.denied
+        # half-open
+        if get_redis().set(self._key("probe"), 1, nx=True, ex=PROBE_TTL):
+            logger.info(f"Probing {self.host}, its circuit breaker is half-open.")
+            return Permit.probe
+        return Permit.denied
+
+    def retry_after(self) -> int:
+        """Seconds after which a denied task can be tried again."""
+        ttl = get_redis().ttl(self._key("open"))
+        # spread the deferred tasks, not to run them all at once
+        return max(ttl, 0) + random.randint(1, self.open_time)
+
+    def _trip(self):
+        logger.warning(f"Opening circuit breaker of {self.host}.")
+        with get_redis().pipeline() as pipe:
+            pipe.set(self._key("tripped"), 1, ex=TRIPPED_TTL)
+            pipe.set(self._key("open"), 1, ex=self.open_time)
+            pipe.delete(self._key("probe"))
+            pipe.execute()
+
+    def _close(self):
+        logger.info(f"Closing circuit breaker of {self.host}.")
+        redis = get_redis()
+        windows = list(redis.scan_iter(match=self._key("window", "*")))
+        redis.delete(self._key("tripped"), self._key("probe"), *windows)
+
+    def record(self, success: bool, permit: Permit):
+        """
+        Record the result of a task.
+
+        Args:
+            success: False if the task failed because of a transient error.
+            permit: What allow() returned for the task.
+        """
+        if permit == Permit.probe:
+            if success:
+                self._close()
+            else:
+                self._trip()
+            return
+
+        # Calls are counted in fixed windows, the error rate is computed
+        # over the current and the previous one, to approximate a sliding window.
+        bucket = int(time()) // self.window
+        key = self._key("window", bucket)
+        with get_redis().pipeline() as pipe:
+            pipe.hincrby(key, "ok" if success else "error", 1)
+            pipe.expire(key, 2 * self.window)
+            pipe.hgetall(self._key("window", bucket - 1))
+            pipe.hgetall(key)
+            pipe.exists(self._key("tripped"))
+            *_, previous, current, tripped = pipe.execute()
+        if success or tripped:
+            return
+
+        errors = int(previous.get("error", 0)) + int(current.get("error", 0))
+        calls = errors + int(previous.get("ok", 0)) + int(current.get("ok", 0))
+        if calls >= self.min_calls and errors / calls >= self.error_rate:
+            self._trip()
@@ -5,3 +5,69 @@ SOURCEGIT_URL = "https://gitlab.com/"
 SOURCEGIT_NAMESPACE = "redhat/centos-stream/src"
 
 DISTGIT_TO_SOURCEGIT_PR_TITLE = "Sync from dist-git"
+
+# Seconds to wait for newer states of the same pipeline/flag
+# before reporting a CI status to a source-git MR, 0 to disable.
+CI_STATUS_COALESCING_WINDOW = 5
+
+# Disk budget (MiB) of the git mirror cache (GIT_MIRROR_CACHE_DIR)
+GIT_MIRROR_CACHE_SIZE = 10 * 1024
+
+# Seconds after which the lock of a source-git MR, which is held while
+# a dist-git MR is being created for it, expires unless its holder renews it.
+MR_SYNC_LOCK_TTL = 5 * 60
+# Seconds to wait for the lock of a source-git MR before deferring the event,
+# just a few not to keep the heavy worker slot busy, 0 to defer right away
+MR_SYNC_LOCK_WAIT = 5
+# Seconds after which an event deferred because of the lock is tried again
+MR_SYNC_LOCK_DEFER = 60
+
+# Seconds for which the branches of a project are cached
+BRANCHES_CACHE_TTL = 10 * 60
+
+# Seconds for which a project (e.g. source-git repo) is remembered not to exist
+MISSING_PROJECTS_CACHE_TTL = 24 * 60 * 60
+
+# Number of parsed package configs kept in the memory of a worker
+PACKAGE_CONFIG_CACHE_SIZE = 256
+# Seconds for which a package config is kept in Redis (PACKAGE_CONFIG_CACHE_SHARED)
+PACKAGE_CONFIG_CACHE_TTL = 7 * 24 * 60 * 60
+
+# Number of deserialized (package & job) configs kept in the memory of a worker
+CONFIGS_CACHE_SIZE = 128
+
+# Seconds for which a source-git MR <-> dist-git MR link is cached
+MR_MAPPING_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Circuit breakers of the git-forge hosts, see circuit_breaker.py:
+# Rate of tasks failed because of transient errors, which trips the breaker
+CIRCUIT_BREAKER_ERROR_RATE = 0.5
+# Minimal number of tasks in the window to compute the error rate from
+CIRCUIT_BREAKER_MIN_CALLS = 10
+# Seconds of the window the error rate is computed over
+CIRCUIT_BREAKER_WINDOW = 60
+# Seconds for which the tasks are deferred once the breaker trips
+CIRCUIT_BREAKER_OPEN_TIME = 60
+
+# Default budget of API calls to a forge host per account, see rate_limit.py:
+# calls per second
+FORGE_API_RATE = 10
+# calls which can be made at once
+FORGE_API_BURST = 100
+# Seconds a handler waits for the budget at most, before it's retried later
+FORGE_API_MAX_WAIT = 60
+# Estimated numbers of API calls of the handlers' stages
+SYNC_API_CALLS = 10
+STATUS_API_CALLS = 2
+
+# Memory budget (MiB) of the worker's cache of the forges' responses
+HTTP_CACHE_SIZE = 64
+
+# Connections kept alive per forge host by each worker process,
+# more can be open at once, those are closed after use (pool_block=False)
+FORGE_POOL_SIZE = 4
+# Timeout (seconds) of connecting to the forges when a worker process starts
+FORGE_WARM_UP_TIMEOUT = 10
+
+# Seconds between pushes of a worker process' metrics to the Pushgateway
+METRICS_PUSH_INTERVAL = 30
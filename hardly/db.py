@@ -0,0 +1,265 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+from logging import getLogger
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from hardly.cache import MRMappingCache
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased, joinedload
+
+from packit_service.models import (
+    GitProjectModel,
+    ProjectEventModel,
+    ProjectEventModelType,
+    PullRequestModel,
+    SourceGitPRDistGitPRModel,
+    sa_session_transaction,
+)
+
+logger = getLogger(__name__)
+
+# INSERT ... ON CONFLICT of the dialects we run on (and test with)
+INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+class PullRequestsRepository:
+    """
+    DB access of the handlers, i.e. to the source-git & dist-git PRs and their links.
+
+    It lives as long as the handler using it, i.e. for one task,
+    and identity-maps the PR models, so that each one is queried just once.
+    The counterpart of a PR is resolved by one joined query,
+    the links are also written through to the MRMappingCache.
+    """
+
+    def __init__(self):
+        self._prs: Dict[Tuple[str, int], PullRequestModel] = {}
+        self._events: Set[Tuple[int, str]] = set()
+
+    def _remember(self, pr: Optional[PullRequestModel]) -> Optional[PullRequestModel]:
+        if pr is None:
+            return None
+        return self._prs.setdefault((pr.project.project_url, pr.pr_id), pr)
+
+    def get_pr(
+        self,
+        project_url: str,
+        pr_id: int,
+        namespace: str,
+        repo_name: str,
+        commit_sha: Optional[str] = None,
+    ) -> PullRequestModel:
+        """
+        Get (or create) a PR model.
+
+        Args:
+            commit_sha: If set, record the commit of the PR as a project event.
+        """
+        key = (project_url, int(pr_id))
+        if (pr := self._prs.get(key)) is None:
+            with sa_session_transaction(commit=True) as session:
+                project = self._get_or_insert(
+                    session,
+                    GitProjectModel,
+                    defaults={"instance_url": urlparse(project_url).hostname},
+                    namespace=namespace,
+                    repo_name=repo_name,
+                    project_url=project_url,
+                )
+                pr = self._prs[key] = self._get_or_insert(
+                    session, PullRequestModel, pr_id=int(pr_id), project_id=project.id
+                )
+        if commit_sha and (pr.id, commit_sha) not in self._events:
+            with sa_session_transaction(commit=True) as session:
+                self._get_or_insert(
+                    session,
+                    ProjectEventModel,
+                    type=pr.project_event_model_type,
+                    event_id=pr.id,
+                    commit_sha=commit_sha,
+                )
+            self._events.add((pr.id, commit_sha))
+        return pr
+
+    @staticmethod
+    def _get_or_insert(
+        session, model, defaults: Optional[Dict[str, Any]] = None, **values
+    ):
+        """
+        Get the row of the model with the values, insert it if there's none.
+
+        Unlike get_or_create() of the models, the insert doesn't fail when
+        another task has inserted the same row in the meantime (ON CONFLICT
+        DO NOTHING) and both tasks end up with the same (first) row.
+
+        Args:
+            defaults: Values of the other columns of an inserted row.
+        """
+        query = session.query(model).filter_by(**values).order_by(model.id)
+        if (row := query.first()) is None:
+            insert = INSERTS[session.get_bind().dialect.name]
+            session.execute(
+                insert(model.__table__)
+                .values(**values, **(defaults or {}))
+                .on_conflict_do_nothing()
+            )
+            row = query.first()
+        return row
+
+    def _get_counterpart(
+        self, project_url: str, pr_id: int, of_source_git: bool
+    ) -> Optional[PullRequestModel]:
+        pr, counterpart = aliased(PullRequestModel), aliased(PullRequestModel)
+        if of_source_git:
+            pr_link = SourceGitPRDistGitPRModel.source_git_pull_request_id
+            counterpart_link = SourceGitPRDistGitPRModel.dist_git_pull_request_id
+        else:
+            pr_link = SourceGitPRDistGitPRModel.dist_git_pull_request_id
+            counterpart_link = SourceGitPRDistGitPRModel.source_git_pull_request_id
+
+        with sa_session_transaction() as session:
+            return self._remember(
+                session.query(counterpart)
+                .join(SourceGitPRDistGitPRModel, counterpart_link == counterpart.id)
+                .join(pr, pr_link == pr.id)
+                .join(GitProjectModel, pr.project_id == GitProjectModel.id)
+                .filter(
+                    GitProjectModel.project_url == project_url,
+                    pr.pr_id == int(pr_id),
+                )
+                .options(joinedload(counterpart.project))
+                .first()
+            )
+
+    def get_dist_git_pr(
+        self, source_git_project_url: str, source_git_pr_id: int
+    ) -> Optional[PullRequestModel]:
+        """Dist-git PR created for the source-git PR, if any."""
+        return self._get_counterpart(
+            source_git_project_url, source_git_pr_id, of_source_git=True
+        )
+
+    def get_source_git_pr(
+        self, dist_git_project_url: str, dist_git_pr_id: int
+    ) -> Optional[PullRequestModel]:
+        """Source-git PR the dist-git PR has been created for, if any."""
+        return self._get_counterpart(
+            dist_git_project_url, dist_git_pr_id, of_source_git=False
+        )
+
+    def get_source_git_pr_ref(
+        self, dist_git_project_url: str, dist_git_pr_id: int
+    ) -> Optional[Tuple[str, int]]:
+        """
+        Project URL & ID of the source-git PR the dist-git PR has been created for.
+
+        Unlike get_source_git_pr(), it doesn't query the DB if the link is cached.
+        """
+        if cached := MRMappingCache.get_source_git_pr(
+            dist_git_project_url, dist_git_pr_id
+        ):
+            return cached
+        if not (
+            source_git_pr := self.get_source_git_pr(
+                dist_git_project_url, dist_git_pr_id
+            )
+        ):
+            return None
+        ref = source_git_pr.project.project_url, source_git_pr.pr_id
+        MRMappingCache.set(
+            source_git=ref, dist_git=(dist_git_project_url, dist_git_pr_id)
+        )
+        return ref
+
+    @staticmethod
+    def _get_recorded_head_commit(project_url: str, pr_id: int) -> Optional[str]:
+        """
+        Commit of the newest project event recorded for the PR, see get_pr().
+
+        The project events have no time of their last occurrence, just ids,
+        and an event is recorded only once per commit. So when the head of the PR
+        is reset to a commit it has already had, this returns the newest
+        commit ever recorded instead, i.e. a stale one. It's used only once
+        the head commit of the newest MR event has expired from MRMappingCache.
+        """
+        with sa_session_transaction() as session:
+            event = (
+                session.query(ProjectEventModel.commit_sha)
+                .join(
+                    PullRequestModel, ProjectEventModel.event_id == PullRequestModel.id
+                )
+                .join(
+                    GitProjectModel, PullRequestModel.project_id == GitProjectModel.id
+                )
+                .filter(
+                    ProjectEventModel.type == ProjectEventModelType.pull_request,
+                    GitProjectModel.project_url == project_url,
+                    PullRequestModel.pr_id == int(pr_id),
+                )
+                .order_by(ProjectEventModel.id.desc())
+                .first()
+            )
+        return event.commit_sha if event else None
+
+    def get_head_commit(self, project_url: str, pr_id: int) -> Optional[str]:
+        """
+        Head commit of a source-git PR.
+
+        The newest MR event records it in MRMappingCache, once that expires,
+        it's the commit of the newest project event of the PR in the DB,
+        so that no API call is needed.
+        """
+        if commit_sha := MRMappingCache.get_head_commit(project_url, pr_id):
+            return commit_sha
+        if commit_sha := self._get_recorded_head_commit(project_url, pr_id):
+            # any MR event (with a real timestamp) is newer
+            MRMappingCache.set_head_commit(project_url, pr_id, commit_sha, timestamp=0)
+        return commit_sha
+
+    @staticmethod
+    def _refs(
+        source_git_pr: PullRequestModel, dist_git_pr: PullRequestModel
+    ) -> Dict[str, Tuple[str, int]]:
+        return {
+            "source_git": (source_git_pr.project.project_url, source_git_pr.pr_id),
+            "dist_git": (dist_git_pr.project.project_url, dist_git_pr.pr_id),
+        }
+
+    @classmethod
+    def link(
+        cls, source_git_pr: PullRequestModel, dist_git_pr: PullRequestModel
+    ) -> bool:
+        """
+        Link the dist-git PR to the source-git PR it has been created for.
+
+        Returns:
+            Whether the link has been created, i.e. didn't exist yet.
+        """
+        with sa_session_transaction(commit=True) as session:
+            insert = INSERTS[session.get_bind().dialect.name]
+            result = session.execute(
+                insert(SourceGitPRDistGitPRModel.__table__)
+                .values(
+                    source_git_pull_request_id=source_git_pr.id,
+                    dist_git_pull_request_id=dist_git_pr.id,
+                )
+                .on_conflict_do_nothing()
+            )
+        if created := result.rowcount == 1:
+            logger.debug(f"Linked {dist_git_pr} to {source_git_pr}")
+            MRMappingCache.set(**cls._refs(source_git_pr, dist_git_pr))
+        return created
+
+
+class PullRequestsRepositoryMixin:
+    """Gives a handler a DB repository for the duration of its task."""
+
+    _db: Optional[PullRequestsRepository] = None
+
+    @property
+    def db(self) -> PullRequestsRepository:
+        if not self._db:
+            self._db = PullRequestsRepository()
+        return self._db
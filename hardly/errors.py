@@ -0,0 +1,81 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""Classification of the errors the handler tasks fail with."""
+
+from typing import Optional
+
+import requests
+from git import GitCommandError
+from redis.exceptions import ConnectionError as RedisConnectionError
+from redis.exceptions import TimeoutError as RedisTimeoutError
+from sqlalchemy.exc import OperationalError
+
+from ogr.exceptions import OgrNetworkError
+
+
+class Deferred(Exception):
+    """
+    Raised by a handler whose task is to be run again later,
+    e.g. because somebody else holds a lock it needs. It's not an error.
+    """
+
+    def __init__(self, message: str, countdown: int):
+        super().__init__(message)
+        self.countdown = countdown
+
+
+# Errors of network/services which may succeed when tried again
+TRANSIENT_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    OgrNetworkError,
+    RedisConnectionError,
+    RedisTimeoutError,
+    # e.g. the DB connection has been lost
+    OperationalError,
+)
+
+# stderr of git commands failing because of network issues
+TRANSIENT_GIT_ERRORS = (
+    "Could not resolve host",
+    "Connection timed out",
+    "Connection reset",
+    "Failed to connect",
+    "The remote end hung up unexpectedly",
+    "early EOF",
+    "RPC failed",
+    "returned error: 5",
+)
+
+
+def get_response_code(ex: BaseException) -> Optional[int]:
+    """HTTP status code of a forge API error (ogr or python-gitlab one)."""
+    try:
+        return getattr(ex, "response_code", None)
+    except Exception:
+        # ogr's APIException.response_code is abstract
+        return None
+
+
+def is_transient_error(ex: BaseException) -> bool:
+    """
+    Tell whether the task failed because of a temporary problem
+    (network errors, server errors & rate limits) and is worth retrying.
+    The exceptions this one has been raised from are checked as well.
+    """
+    seen = set()
+    while ex is not None and id(ex) not in seen:
+        seen.add(id(ex))
+        if isinstance(ex, TRANSIENT_ERRORS):
+            return True
+        if isinstance(response_code := get_response_code(ex), int) and (
+            response_code == 429 or response_code >= 500
+        ):
+            return True
+        if isinstance(ex, GitCommandError) and any(
+            message in str(ex.stderr) for message in TRANSIENT_GIT_ERRORS
+        ):
+            return True
+        ex = ex.__cause__ or ex.__context__
+    return False
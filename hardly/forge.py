@@ -0,0 +1,135 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+from logging import getLogger
+from os import getenv
+from threading import Lock, Thread
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+import requests
+
+from hardly.constants import FORGE_WARM_UP_TIMEOUT
+from hardly.monitoring import forge_cache_lookups
+from ogr.abstract import GitProject, GitService, PullRequest
+from ogr.services.gitlab import GitlabService
+from packit_service.config import ServiceConfig
+
+logger = getLogger(__name__)
+
+
+class ForgeObjectsCache:
+    """
+    Identity map of git-forge (ogr) projects & PRs.
+
+    It lives as long as the handler using it, i.e. for one task,
+    so that the objects (and the data they have already fetched)
+    are reused instead of being fetched via the API again.
+    """
+
+    def __init__(self, service_config: ServiceConfig):
+        self.service_config = service_config
+        self._projects: Dict[str, GitProject] = {}
+        # the projects are kept in the values, so that their id()s are not reused
+        self._prs: Dict[Tuple[int, int], Tuple[GitProject, PullRequest]] = {}
+
+    @staticmethod
+    def _count(kind: str, hit: bool):
+        forge_cache_lookups.labels(kind=kind, result="hit" if hit else "miss").inc()
+
+    def get_project(self, url: str) -> GitProject:
+        key = url.rstrip("/").removesuffix(".git")
+        project = self._projects.get(key)
+        self._count("project", hit=project is not None)
+        if project is None:
+            project = self._projects[key] = self.service_config.get_project(url=url)
+        return project
+
+    def get_pr(self, project: GitProject, pr_id: Union[int, str]) -> PullRequest:
+        # projects are identity-mapped, so the same project is the same object
+        key = (id(project), int(pr_id))
+        cached = self._prs.get(key)
+        self._count("pr", hit=cached is not None)
+        if cached is None:
+            cached = self._prs[key] = (project, project.get_pr(int(pr_id)))
+        return cached[1]
+
+
+class ForgeCacheMixin:
+    """Gives a handler a cache of forge objects for the duration of its task."""
+
+    _forge_cache: Optional[ForgeObjectsCache] = None
+
+    @property
+    def forge_cache(self) -> ForgeObjectsCache:
+        if not self._forge_cache:
+            self._forge_cache = ForgeObjectsCache(self.service_config)
+        return self._forge_cache
+
+
+def get_session(service: GitService) -> Optional[requests.Session]:
+    """Session the service makes its API calls with."""
+    if isinstance(service, GitlabService):
+        # python-gitlab's session
+        return service.gitlab_instance.session
+    return getattr(service, "session", None)
+
+
+def warm_up(service: GitService, session: requests.Session):
+    """
+    Open a connection to the forge, so that the first task doesn't wait for the handshakes.
+
+    The session keeps it alive for the next API calls.
+    """
+    timeout = float(getenv("FORGE_WARM_UP_TIMEOUT", FORGE_WARM_UP_TIMEOUT))
+    try:
+        session.head(service.instance_url, timeout=timeout)
+    except requests.RequestException as ex:
+        logger.info(f"Can't connect to {service.instance_url}: {ex!r}")
+
+
+class SessionsSetup(Thread):
+    """
+    Sets up the forges' sessions and warms them up in the background.
+
+    Getting a GitLab session authenticates (without any timeout) and a forge
+    may be slow or down, which must not block the start of a worker process.
+    The first task waits for the setup, see wait(), if it's not done in time,
+    the rest of it is given up, so that the sessions are never modified
+    while a task is using them.
+    """
+
+    def __init__(
+        self,
+        services: Iterable[GitService],
+        configure: Callable[[GitService, requests.Session], None],
+    ):
+        super().__init__(name="forge-sessions-setup", daemon=True)
+        self.services = list(services)
+        self.configure = configure
+        self._lock = Lock()
+        self._abandoned = False
+
+    def run(self):
+        for service in self.services:
+            try:
+                session = get_session(service)
+            except Exception as ex:
+                logger.warning(f"Can't set up session of {service}: {ex!r}")
+                continue
+            if session is None:
+                continue
+            with self._lock:
+                if self._abandoned:
+                    return
+                self.configure(service, session)
+            warm_up(service, session)
+
+    def wait(self, timeout: float):
+        """Wait for the setup to finish, give up the rest of it after the timeout."""
+        if self._abandoned:
+            return
+        self.join(timeout)
+        with self._lock:
+            if self.is_alive():
+                logger.warning(f"Forge sessions not set up in {timeout}s, giving up.")
+                self._abandoned = True
@@ -0,0 +1,132 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import fcntl
+import shutil
+import tempfile
+from contextlib import contextmanager
+from functools import lru_cache
+from hashlib import sha256
+from logging import getLogger
+from os import getenv, utime
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+import git
+from ogr.parsing import RepoUrl
+
+from hardly.constants import GIT_MIRROR_CACHE_SIZE
+from packit.utils.repo import RepositoryCache, is_git_repo
+
+logger = getLogger(__name__)
+
+
+class MirrorRepositoryCache(RepositoryCache):
+    """
+    Worker-local cache of bare mirrors of git repositories, keyed by the URL.
+
+    Instead of cloning over the network, a repository is cloned from its mirror
+    (which only needs to be incrementally fetched), that's cheap because git
+    hardlinks the objects of local clones.
+    The least recently used mirrors are removed once the cache is bigger than max_size.
+    """
+
+    def __init__(self, cache_path: Union[str, Path], max_size: int) -> None:
+        super().__init__(cache_path=cache_path, add_new=True)
+        self.max_size = max_size
+
+    def mirror_path(self, url: str) -> Path:
+        # keep the repo name in the path, so that it's easier to debug
+        digest = sha256(url.encode()).hexdigest()[:16]
+        repo = parsed.repo if (parsed := RepoUrl.parse(url)) else "repo"
+        return self.cache_path / f"{repo}-{digest}.git"
+
+    @staticmethod
+    @contextmanager
+    def _lock(mirror: Path, blocking: bool = True) -> Iterator[bool]:
+        """Lock the mirror against the other worker processes."""
+        with open(mirror.with_suffix(".lock"), "w") as lock_file:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _update_mirror(self, url: str, mirror: Path) -> None:
+        """Create the mirror of the repository or fetch what's new."""
+        if (mirror / "HEAD").exists():
+            logger.debug(f"Fetching {url} into mirror {mirror}")
+            git.Repo(mirror).git.fetch(
+                "--prune",
+                url,
+                "+refs/heads/*:refs/heads/*",
+                "+refs/tags/*:refs/tags/*",
+            )
+        else:
+            logger.debug(f"Creating mirror {mirror} of {url}")
+            self._clone(url=url, to_path=str(mirror), bare=True)
+            self.projects_added.append(url)
+        # the modification time tells when the mirror has been used last
+        utime(mirror)
+
+    def get_repo(
+        self,
+        url: str,
+        directory: Union[Path, str, None] = None,
+    ) -> git.Repo:
+        directory = str(directory) if directory else tempfile.mkdtemp()
+
+        if is_git_repo(directory=directory):
+            logger.debug(f"Repo already exists in {directory}.")
+            return git.repo.Repo(directory)
+
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        mirror = self.mirror_path(url)
+        with self._lock(mirror):
+            self._update_mirror(url, mirror)
+            logger.debug(f"Cloning repo {url} -> {directory} from mirror {mirror}")
+            repo = self._clone(url=str(mirror), to_path=directory, tags=True)
+        repo.remote("origin").set_url(url)
+        self.projects_cloned_using_cache.append(url)
+
+        self.evict(keep=mirror)
+        return repo
+
+    @staticmethod
+    def _size(path: Path) -> int:
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        """Remove the least recently used mirrors to fit into the max_size."""
+        mirrors = sorted(
+            (m for m in self.cache_path.glob("*.git") if m.is_dir()),
+            key=lambda m: m.stat().st_mtime,
+        )
+        sizes = {mirror: self._size(mirror) for mirror in mirrors}
+        total = sum(sizes.values())
+        for mirror in mirrors:
+            if total <= self.max_size:
+                break
+            if mirror == keep:
+                continue
+            with self._lock(mirror, blocking=False) as locked:
+                if not locked:
+                    # being used right now
+                    continue
+                logger.info(f"Removing mirror {mirror} from the cache.")
+                shutil.rmtree(mirror, ignore_errors=True)
+                total -= sizes[mirror]
+
+
+@lru_cache(maxsize=None)
+def get_repository_cache() -> Optional[MirrorRepositoryCache]:
+    """The mirror cache, if it's configured by GIT_MIRROR_CACHE_DIR."""
+    if not (cache_path := getenv("GIT_MIRROR_CACHE_DIR")):
+        return None
+    max_size = int(getenv("GIT_MIRROR_CACHE_SIZE", GIT_MIRROR_CACHE_SIZE))
+    return MirrorRepositoryCache(cache_path=cache_path, max_size=max_size * 1024**2)
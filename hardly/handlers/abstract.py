@@ -2,8 +2,10 @@
 # SPDX-License-Identifier: MIT
 
 from collections import defaultdict
+from copy import deepcopy
 from enum import Enum
-from typing import Set, Type, Dict
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Set, Type
 
 from packit_service.worker.events import Event
 from packit_service.worker.handlers import JobHandler
@@ -11,16 +13,84 @@ from packit_service.worker.handlers import JobHandler
 SUPPORTED_EVENTS_FOR_HANDLER: Dict[Type[JobHandler], Set[Type[Event]]] = defaultdict(
     set
 )
+# Inverse of SUPPORTED_EVENTS_FOR_HANDLER, used to build the dispatch index
+HANDLERS_FOR_EVENT: Dict[Type[Event], Set[Type[JobHandler]]] = defaultdict(set)
 
 
 def reacts_to(event: Type[Event]):
     def _add_to_mapping(kls: Type[JobHandler]):
         SUPPORTED_EVENTS_FOR_HANDLER[kls].add(event)
+        HANDLERS_FOR_EVENT[event].add(kls)
+        # a new registration can change the result for any already indexed class
+        get_handlers_for_event_class.cache_clear()
         return kls
 
     return _add_to_mapping
 
 
+@lru_cache(maxsize=None)
+def get_handlers_for_event_class(
+    event_class: Type[Event],
+) -> FrozenSet[Type[JobHandler]]:
+    """Handlers reacting to the event class or to any of its base classes.
+
+    The result is memoized per concrete event class, so that the dispatch
+    doesn't grow with the number of registered handlers.
+    """
+    return frozenset(
+        handler
+        for kls in event_class.__mro__
+        for handler in HANDLERS_FOR_EVENT.get(kls, ())
+    )
+
+
+class CopiedOnAccess:
+    """
+    Attribute holding a shared object, which is deep-copied the first time
+    it's read on an instance, so that the instance can modify it freely.
+    Only the first value set on an instance is considered shared,
+    values set later are the instance's own.
+    """
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+    def __get__(self, obj, objtype=None) -> Any:
+        if obj is None:
+            return self
+        value, shared = obj.__dict__[self.name]
+        if shared:
+            value = deepcopy(value)
+            obj.__dict__[self.name] = value, False
+        return value
+
+    def __set__(self, obj, value: Any):
+        obj.__dict__[self.name] = value, self.name not in obj.__dict__
+
+
+class SharedConfigsMixin:
+    """
+    The configs a handler gets are shared by all the tasks of the worker
+    (see hardly.tasks.load_configs()), the handler works with its own copies.
+    Has to precede JobHandler in the bases.
+    """
+
+    package_config = CopiedOnAccess()
+    job_config = CopiedOnAccess()
+
+
+class TaskCost(str, Enum):
+    """
+    How expensive the handler's task is, tasks of each cost class
+    are sent to a separate queue served by differently sized workers.
+    """
+
+    # only a few API calls, e.g. status relays
+    light = "short-running"
+    # cloning, syncing & pushing
+    heavy = "long-running"
+
+
 class TaskName(str, Enum):
     source_git_pr_to_dist_git_pr = "task.run_source_git_pr_to_dist_git_pr_handler"
     gitlab_ci_to_source_git_pr = "task.run_gitlab_ci_to_source_git_pr_handler"
@@ -4,17 +4,19 @@
 import re
 from logging import getLogger
 from os import getenv
-from typing import Optional
+from typing import Dict, Optional, Tuple
 
-from hardly.handlers.abstract import TaskName, reacts_to
+from celery.canvas import Signature
+
+from hardly.constants import CI_STATUS_COALESCING_WINDOW, STATUS_API_CALLS
+from hardly.db import PullRequestsRepositoryMixin
+from hardly.forge import ForgeCacheMixin
+from hardly.handlers.abstract import SharedConfigsMixin, TaskCost, TaskName, reacts_to
+from hardly.rate_limit import throttle
+from hardly.store import Generation, VersionedState, get_redis, make_key
 from packit.config.job_config import JobConfig
 from packit.config.package_config import PackageConfig
-from packit_service.models import (
-    PullRequestModel,
-    ProjectEventModel,
-    SourceGitPRDistGitPRModel,
-)
-from packit_service.worker.events import PipelineGitlabEvent
+from packit_service.worker.events import Event, PipelineGitlabEvent
 from packit_service.worker.events.pagure import PullRequestFlagPagureEvent
 from packit_service.worker.handlers.abstract import JobHandler
 from packit_service.worker.mixin import (
@@ -26,12 +28,22 @@ from packit_service.worker.result import TaskResults
 
 logger = getLogger(__name__)
 
+# How long to remember the state of a pipeline/flag for coalescing
+COALESCING_TTL = 60 * 60
+
 
 class DistGitCIToSourceGitPRHandler(
+    SharedConfigsMixin,
     JobHandler,
     ConfigFromEventMixin,
     PackitAPIWithUpstreamMixin,
+    ForgeCacheMixin,
+    PullRequestsRepositoryMixin,
 ):
+    task_cost = TaskCost.light
+    # CI system status -> commit status we report
+    status_states: Dict[str, BaseCommitStatus] = {}
+
     def __init__(
         self,
         package_config: PackageConfig,
@@ -49,9 +61,81 @@ class DistGitCIToSourceGitPRHandler(
         self.status_check_name: Optional[str] = None
         self.status_url: Optional[str] = None
 
-    def dist_git_pr_model(self) -> Optional[PullRequestModel]:
+    def dist_git_pr_key(self) -> Optional[Tuple[str, int]]:
+        """Project URL & ID of the dist-git PR the CI ran for."""
         raise NotImplementedError("This should have been implemented.")
 
+    @classmethod
+    def coalescing_key(cls, event: dict) -> str:
+        """Identifies the pipeline/flag whose states are coalesced."""
+        raise NotImplementedError("This should have been implemented.")
+
+    @classmethod
+    def is_terminal_state(cls, event: dict) -> bool:
+        # Unknown (e.g. newly added by the forge) states are not terminal,
+        # not to suppress any later states and not to fail at ingress.
+        state = cls.status_states.get(event.get("status"), BaseCommitStatus.pending)
+        return state not in (
+            BaseCommitStatus.pending,
+            BaseCommitStatus.running,
+        )
+
+    @classmethod
+    def get_signature(
+        cls, event: Event, job: Optional[JobConfig]
+    ) -> Optional[Signature]:
+        """
+        Delay the task by a coalescing window so that when more states
+        of the same pipeline/flag come in the meantime, only the latest one
+        is reported. Once a terminal state has been seen, any later
+        pending/running states are not reported at all, so no task is
+        scheduled for them (None is returned).
+        """
+        signature = super().get_signature(event=event, job=job)
+        window = int(getenv("CI_STATUS_COALESCING_WINDOW", CI_STATUS_COALESCING_WINDOW))
+        if not window:
+            return signature
+
+        event_dict = signature.kwargs["event"]
+        key = cls.coalescing_key(event_dict)
+        terminal_key = make_key("ci-status-terminal", key)
+        if cls.is_terminal_state(event_dict):
+            get_redis().set(terminal_key, 1, ex=COALESCING_TTL)
+        elif get_redis().exists(terminal_key):
+            logger.debug(
+                f"Not reporting {event_dict.get('status')} of {key}, it's over."
+            )
+            return None
+
+        event_dict["coalescing_generation"] = Generation(
+            "ci-status", key, ttl=COALESCING_TTL
+        ).bump()
+        return signature.set(countdown=window)
+
+    def status_version(self) -> Tuple[int, int]:
+        """
+        Version of the reported status used to tell which one is the newest
+        when the events are processed out of order.
+        """
+        timestamp = self.data.event_dict.get(
+            "date_updated"
+        ) or self.data.event_dict.get("created_at", 0)
+        # pending -> running -> any terminal state
+        order = {BaseCommitStatus.pending: 0, BaseCommitStatus.running: 1}.get(
+            self.status_state, 2
+        )
+        return int(timestamp), order
+
+    def is_coalesced(self) -> bool:
+        """Has there been a newer state of the pipeline/flag than this one?"""
+        if (generation := self.data.event_dict.get("coalescing_generation")) is None:
+            return False
+        return not Generation(
+            "ci-status",
+            self.coalescing_key(self.data.event_dict),
+            ttl=COALESCING_TTL,
+        ).is_current(generation)
+
     @staticmethod
     def get_gitlab_account_name() -> str:
         # https://github.com/packit/ogr/issues/751
@@ -67,34 +151,62 @@ class DistGitCIToSourceGitPRHandler(
         When a dist-git PR flag/pipeline is updated, create a commit
         status in the original source-git MR with the flag/pipeline info.
         """
-        if not (dist_git_pr_model := self.dist_git_pr_model()):
-            logger.debug("No dist-git PR model.")
+        if self.is_coalesced():
+            logger.debug(
+                f"Not reporting {self.status_state} of "
+                f"{self.coalescing_key(self.data.event_dict)}, there's a newer one."
+            )
             return TaskResults(success=True)
-        if not (
-            sg_dg := SourceGitPRDistGitPRModel.get_by_dist_git_id(dist_git_pr_model.id)
-        ):
-            logger.debug(f"Source-git PR for {dist_git_pr_model} not found.")
+
+        if not (dist_git_pr_key := self.dist_git_pr_key()):
+            logger.debug("No dist-git PR.")
+            return TaskResults(success=True)
+        if not (source_git_pr_ref := self.db.get_source_git_pr_ref(*dist_git_pr_key)):
+            logger.debug(f"Source-git PR for {dist_git_pr_key} not found.")
             return TaskResults(success=True)
 
-        source_git_pr_model = sg_dg.source_git_pull_request
-        source_git_project = self.service_config.get_project(
-            url=source_git_pr_model.project.project_url
+        source_git_project_url, source_git_pr_id = source_git_pr_ref
+        last_reported = VersionedState(
+            "ci-status",
+            source_git_project_url,
+            source_git_pr_id,
+            self.status_check_name,
         )
-        source_git_pr = source_git_project.get_pr(source_git_pr_model.pr_id)
+        if not last_reported.set_if_newer(
+            self.status_version(), self.status_state.value
+        ):
+            logger.debug(
+                f"Not reporting {self.status_state} for {self.status_check_name}, "
+                "a newer status has already been reported to "
+                f"{source_git_project_url}!{source_git_pr_id}."
+            )
+            return TaskResults(success=True)
+
+        source_git_project = self.forge_cache.get_project(url=source_git_project_url)
+        # The head commit is the latest commit of the MR, recorded from the MR events
+        # (in Redis and the DB), taken from the MR itself only if it's not recorded yet.
+        # If there was a new commit pushed before the pipeline ended, the report
+        # might be incorrect until the new (for the new commit) pipeline finishes.
+        if not (
+            head_commit := self.db.get_head_commit(
+                source_git_project_url, source_git_pr_id
+            )
+        ):
+            head_commit = self.forge_cache.get_pr(
+                source_git_project, source_git_pr_id
+            ).head_commit
 
+        throttle(source_git_project.service, STATUS_API_CALLS)
         status_reporter = StatusReporter.get_instance(
             project=source_git_project,
-            # The head_commit is the latest commit of the MR.
-            # If there was a new commit pushed before the pipeline ended, the report
-            # might be incorrect until the new (for the new commit) pipeline finishes.
-            commit_sha=source_git_pr.head_commit,
+            commit_sha=head_commit,
             packit_user=self.get_gitlab_account_name(),
         )
         # Our account(s) have no access (unless it's manually added) into the fork repos,
         # to set the commit status (which would look like a Pipeline result)
         # so the status reporter fallbacks to adding a commit comment.
-        # To not pollute MRs with too many comments, we might later skip
-        # the 'Pipeline is pending/running' events.
+        # To not pollute MRs with too many comments, the intermediate states
+        # are coalesced, see get_signature().
         # See also https://github.com/packit/packit-service/issues/1411
         status_reporter.set_status(
             state=self.status_state,
@@ -108,6 +220,20 @@ class DistGitCIToSourceGitPRHandler(
 @reacts_to(event=PipelineGitlabEvent)
 class GitlabCIToSourceGitPRHandler(DistGitCIToSourceGitPRHandler):
     task_name = TaskName.gitlab_ci_to_source_git_pr
+    # https://docs.gitlab.com/ee/api/pipelines.html#list-project-pipelines -> status
+    status_states = {
+        "pending": BaseCommitStatus.pending,
+        "created": BaseCommitStatus.pending,
+        "waiting_for_resource": BaseCommitStatus.pending,
+        "preparing": BaseCommitStatus.pending,
+        "scheduled": BaseCommitStatus.pending,
+        "manual": BaseCommitStatus.pending,
+        "running": BaseCommitStatus.running,
+        "success": BaseCommitStatus.success,
+        "skipped": BaseCommitStatus.success,
+        "failed": BaseCommitStatus.failure,
+        "canceled": BaseCommitStatus.failure,
+    }
 
     def __init__(
         self,
@@ -121,20 +247,7 @@ class GitlabCIToSourceGitPRHandler(DistGitCIToSourceGitPRHandler):
             event=event,
         )
 
-        # https://docs.gitlab.com/ee/api/pipelines.html#list-project-pipelines -> status
-        self.status_state: BaseCommitStatus = {
-            "pending": BaseCommitStatus.pending,
-            "created": BaseCommitStatus.pending,
-            "waiting_for_resource": BaseCommitStatus.pending,
-            "preparing": BaseCommitStatus.pending,
-            "scheduled": BaseCommitStatus.pending,
-            "manual": BaseCommitStatus.pending,
-            "running": BaseCommitStatus.running,
-            "success": BaseCommitStatus.success,
-            "skipped": BaseCommitStatus.success,
-            "failed": BaseCommitStatus.failure,
-            "canceled": BaseCommitStatus.failure,
-        }[event["status"]]
+        self.status_state: BaseCommitStatus = self.status_states[event["status"]]
         self.status_description: str = f"Changed status to {event['detailed_status']}"
         self.status_check_name: str = "Dist-git MR CI Pipeline"
         self.status_url: str = (
@@ -144,7 +257,11 @@ class GitlabCIToSourceGitPRHandler(DistGitCIToSourceGitPRHandler):
         self.merge_request_url: str = event["merge_request_url"]
         self.commit_sha = event["commit_sha"]
 
-    def dist_git_pr_model(self) -> Optional[PullRequestModel]:
+    @classmethod
+    def coalescing_key(cls, event: dict) -> str:
+        return f"{event['project_url']}/-/pipelines/{event['pipeline_id']}"
+
+    def dist_git_pr_key(self) -> Optional[Tuple[str, int]]:
         if self.source == "merge_request_event":
             if not self.merge_request_url:
                 logger.debug(f"No merge_request_url in {self.data.event_dict}")
@@ -154,25 +271,21 @@ class GitlabCIToSourceGitPRHandler(DistGitCIToSourceGitPRHandler):
             if m := re.fullmatch(
                 r"(\S+)/-/merge_requests/(\d+)", self.merge_request_url
             ):
-                project = self.service_config.get_project(url=m[1])
-                pr_model = PullRequestModel.get_or_create(
-                    pr_id=int(m[2]),
-                    namespace=project.namespace,
-                    repo_name=project.repo,
-                    project_url=m[1],
-                )
-                ProjectEventModel.get_or_create(
-                    type=pr_model.project_event_model_type,
-                    event_id=pr_model.id,
-                    commit_sha=self.commit_sha,
-                )
-                return pr_model
+                return m[1], int(m[2])
         return None
 
 
 @reacts_to(event=PullRequestFlagPagureEvent)
 class PagureCIToSourceGitPRHandler(DistGitCIToSourceGitPRHandler):
     task_name = TaskName.pagure_ci_to_source_git_pr
+    # https://pagure.io/api/0/#pull_requests-tab -> "Flag a pull-request" -> status
+    status_states = {
+        "pending": BaseCommitStatus.pending,
+        "success": BaseCommitStatus.success,
+        "error": BaseCommitStatus.error,
+        "failure": BaseCommitStatus.failure,
+        "canceled": BaseCommitStatus.failure,
+    }
 
     def __init__(
         self,
@@ -186,17 +299,19 @@ class PagureCIToSourceGitPRHandler(DistGitCIToSourceGitPRHandler):
             event=event,
         )
 
-        # https://pagure.io/api/0/#pull_requests-tab -> "Flag a pull-request" -> status
-        self.status_state = {
-            "pending": BaseCommitStatus.pending,
-            "success": BaseCommitStatus.success,
-            "error": BaseCommitStatus.error,
-            "failure": BaseCommitStatus.failure,
-            "canceled": BaseCommitStatus.failure,
-        }[event["status"]]
+        self.status_state = self.status_states[event["status"]]
         self.status_description = event["comment"]
         self.status_check_name = event["username"]
         self.status_url = event["url"]
 
-    def dist_git_pr_model(self) -> Optional[PullRequestModel]:
-        return self.data.db_project_object
+    @classmethod
+    def coalescing_key(cls, event: dict) -> str:
+        # The flag's uid is not part of the event, but a CI system
+        # (username) has just one flag per commit of a PR.
+        return (
+            f"{event['project_url']}/pull-request/{event['pr_id']}"
+            f"/{event['commit_sha']}#{event['username']}"
+        )
+
+    def dist_git_pr_key(self) -> Optional[Tuple[str, int]]:
+        return self.data.project_url, int(self.data.pr_id)
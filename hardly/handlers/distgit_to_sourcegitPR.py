@@ -5,12 +5,18 @@ from logging import getLogger
 from os import getenv
 from typing import Optional
 
+from hardly.cache import BranchesCache, MissingProjectsCache, PackageConfigCache
 from hardly.constants import (
     DISTGIT_TO_SOURCEGIT_PR_TITLE,
     SOURCEGIT_URL,
     SOURCEGIT_NAMESPACE,
+    SYNC_API_CALLS,
 )
-from hardly.handlers.abstract import TaskName, reacts_to
+from hardly.forge import ForgeCacheMixin
+from hardly.git_cache import get_repository_cache
+from hardly.handlers.abstract import SharedConfigsMixin, TaskCost, TaskName, reacts_to
+from hardly.rate_limit import throttle
+from ogr.abstract import GitProject
 from packit.api import PackitAPI
 from packit.config.job_config import JobConfig
 from packit.config.package_config import PackageConfig
@@ -31,11 +37,14 @@ logger = getLogger(__name__)
 @reacts_to(event=PushGitlabEvent)
 @reacts_to(event=PushPagureEvent)
 class DistGitToSourceGitPRHandler(
+    SharedConfigsMixin,
     JobHandler,
     ConfigFromEventMixin,
     PackitAPIWithUpstreamMixin,
+    ForgeCacheMixin,
 ):
     task_name = TaskName.dist_git_to_source_git_pr
+    task_cost = TaskCost.heavy
 
     def __init__(
         self,
@@ -48,33 +57,47 @@ class DistGitToSourceGitPRHandler(
             job_config=job_config,
             event=event,
         )
+        self._source_git_project: Optional[GitProject] = None
         self._source_git_local_project: Optional[LocalProject] = None
         self._dist_git_local_project: Optional[LocalProject] = None
-        self._lp_builder = LocalProjectBuilder()
+        self._lp_builder = LocalProjectBuilder(cache=get_repository_cache())
+
+    @property
+    def source_git_project_url(self) -> str:
+        base_url = getenv("SOURCEGIT_URL", SOURCEGIT_URL)
+        # If the source-git namespace can't be derived from dist-git
+        # namespace by just replacing rpms->src
+        # (e.g. src @ gitlab, rpms @ pagure)
+        # then it must be defined as env. var.
+        if not (namespace := getenv("SOURCEGIT_NAMESPACE")):
+            namespace = self.project.namespace.replace(
+                f"{DISTGIT_INSTANCES['centpkg'].namespace}",
+                f"{SOURCEGIT_NAMESPACE}",
+            )
+        # Assume the repo name is the same
+        return f"{base_url}{namespace}/{self.project.repo}.git"
+
+    @property
+    def source_git_project(self) -> Optional[GitProject]:
+        """The source-git project, if it exists, without cloning it."""
+        if not self._source_git_project:
+            project_url = self.source_git_project_url
+            if MissingProjectsCache.is_missing(project_url):
+                return None
+            project = self.forge_cache.get_project(url=project_url)
+            if not project.exists():
+                MissingProjectsCache.mark_missing(project_url)
+                return None
+            self._source_git_project = project
+        return self._source_git_project
 
     @property
     def source_git_local_project(self):
-        if not self._source_git_local_project:
-            dg_lp = self.dist_git_local_project
-            base_url = getenv("SOURCEGIT_URL", SOURCEGIT_URL)
-            # If the source-git namespace can't be derived from dist-git
-            # namespace by just replacing rpms->src
-            # (e.g. src @ gitlab, rpms @ pagure)
-            # then it must be defined as env. var.
-            if not (namespace := getenv("SOURCEGIT_NAMESPACE")):
-                namespace = dg_lp.namespace.replace(
-                    f"{DISTGIT_INSTANCES['centpkg'].namespace}",
-                    f"{SOURCEGIT_NAMESPACE}",
-                )
-            # Assume the repo name is the same
-            project_url = f"{base_url}{namespace}/{dg_lp.repo_name}.git"
-            project = self.service_config.get_project(url=project_url)
-            self._source_git_local_project = (
-                self._lp_builder.build(
-                    git_project=project, git_repo=CALCULATE, working_dir=CALCULATE
-                )
-                if project.exists()
-                else None
+        if not self._source_git_local_project and self.source_git_project:
+            self._source_git_local_project = self._lp_builder.build(
+                git_project=self.source_git_project,
+                git_repo=CALCULATE,
+                working_dir=CALCULATE,
             )
         return self._source_git_local_project
 
@@ -91,15 +114,29 @@ class DistGitToSourceGitPRHandler(
             )
         return self._dist_git_local_project
 
+    def get_source_git_package_config(self) -> Optional[PackageConfig]:
+        """Package config from the head of the cloned source-git repo."""
+        project = self.source_git_local_project.git_project
+        project_url = self.source_git_project_url
+        commit_sha = self.source_git_local_project.git_repo.head.commit.hexsha
+        if package_config := PackageConfigCache.get(project_url, commit_sha):
+            logger.debug(f"Using cached package config of {project_url}@{commit_sha}")
+            return package_config
+
+        package_config = PackageConfigGetter.get_package_config_from_repo(
+            project=project, reference=commit_sha
+        )
+        if package_config:
+            PackageConfigCache.set(project_url, commit_sha, package_config)
+        return package_config
+
     @property
     def packit_api(self):
         if not self._packit_api:
             # The package_config we got in __init__() is most likely None
             # because there's usually no .packit.yaml in dist-git repos.
             # We need to get the one from the source-git repo.
-            self.package_config = PackageConfigGetter.get_package_config_from_repo(
-                project=self.source_git_local_project.git_project
-            )
+            self.package_config = self.get_source_git_package_config()
             self._packit_api = PackitAPI(
                 config=self.service_config,
                 package_config=self.package_config,
@@ -113,12 +150,13 @@ class DistGitToSourceGitPRHandler(
         As a reaction to dist-git being updated,
         update the source-git repo by opening a PR.
         """
-        if not self.source_git_local_project:
+        if not self.source_git_project:
             logger.debug(f"There's no source-git repo for {self.project}")
             return TaskResults(success=True)
 
+        # Before anything gets cloned.
         branch = self.data.git_ref
-        if branch not in self.source_git_local_project.git_project.get_branches():
+        if not BranchesCache.branch_exists(self.source_git_project, branch):
             logger.info(f"No {branch!r} branch in source-git repo to update")
             return TaskResults(success=True)
 
@@ -127,6 +165,7 @@ class DistGitToSourceGitPRHandler(
             f"About to sync {self.dist_git_local_project.git_project}#{branch}"
             f" to {self.source_git_local_project.git_project}#{branch}"
         )
+        throttle(self.source_git_local_project.git_project.service, SYNC_API_CALLS)
         self.packit_api.sync_push(
             dist_git_branch=branch,
             source_git_branch=branch,
@@ -2,23 +2,36 @@
 # SPDX-License-Identifier: MIT
 
 import re
+from functools import lru_cache
 from logging import getLogger
 from os import getenv
-from typing import Optional
-
-from hardly.constants import DISTGIT_TO_SOURCEGIT_PR_TITLE
-from hardly.handlers.abstract import TaskName, reacts_to
+from typing import Iterable, List, Optional, Pattern, Tuple
+
+from celery.canvas import Signature
+from git import GitCommandError
+
+from hardly.cache import BranchesCache, MRMappingCache
+from hardly.constants import (
+    DISTGIT_TO_SOURCEGIT_PR_TITLE,
+    MR_SYNC_LOCK_DEFER,
+    MR_SYNC_LOCK_TTL,
+    MR_SYNC_LOCK_WAIT,
+    SYNC_API_CALLS,
+)
+from hardly.db import PullRequestsRepositoryMixin
+from hardly.errors import Deferred
+from hardly.forge import ForgeCacheMixin
+from hardly.git_cache import get_repository_cache
+from hardly.handlers.abstract import SharedConfigsMixin, TaskCost, TaskName, reacts_to
+from hardly.rate_limit import throttle
+from hardly.store import Generation, lease
 from ogr.abstract import PullRequest
 from packit.api import PackitAPI
 from packit.config.job_config import JobConfig
 from packit.config.package_config import PackageConfig
 from packit.local_project import CALCULATE, LocalProject, LocalProjectBuilder
-from packit_service.models import (
-    PullRequestModel,
-    SourceGitPRDistGitPRModel,
-    ProjectEventModel,
-)
-from packit_service.worker.events import MergeRequestGitlabEvent
+from packit_service.models import PullRequestModel
+from packit_service.worker.events import Event, MergeRequestGitlabEvent
 from packit_service.worker.events.enums import GitlabEventAction
 from packit_service.worker.handlers.abstract import JobHandler
 from packit_service.worker.mixin import (
@@ -30,6 +43,10 @@ from packit_service.worker.result import TaskResults
 logger = getLogger(__name__)
 
 
+class SyncSuperseded(Exception):
+    """A newer commit has been pushed to the source-git MR in the meantime."""
+
+
 def fix_bz_refs(message: str) -> str:
     """Convert Bugzilla references to the format accepted by BZ checks
 
@@ -49,13 +66,50 @@ def fix_bz_refs(message: str) -> str:
     return re.sub(pattern, repl, message, flags=re.MULTILINE)
 
 
+@lru_cache(maxsize=None)
+def compile_targets(
+    targets: Tuple[Tuple[Optional[str], Optional[str]], ...]
+) -> Tuple[Tuple[Pattern, Pattern], ...]:
+    """Compile (repo, branch) regexes of the handled MR targets, just once."""
+    return tuple(
+        (re.compile(repo or ".+"), re.compile(branch or ".+"))
+        for repo, branch in targets
+    )
+
+
+def is_target_handled(
+    handled_targets: Optional[Iterable], target_repo: str, target_branch: str
+) -> bool:
+    """
+    Tell if a target repo and branch pair of an MR should be handled or ignored.
+
+    Args:
+        handled_targets: gitlab_mr_targets_handled of the service config.
+    """
+    # If nothing is configured, all targets are handled.
+    if not handled_targets:
+        return True
+
+    targets = compile_targets(
+        tuple((target.repo, target.branch) for target in handled_targets)
+    )
+    return any(
+        repo.fullmatch(target_repo) and branch.fullmatch(target_branch)
+        for repo, branch in targets
+    )
+
+
 @reacts_to(event=MergeRequestGitlabEvent)
 class SourceGitPRToDistGitPRHandler(
+    SharedConfigsMixin,
     JobHandler,
     ConfigFromEventMixin,
     PackitAPIWithUpstreamMixin,
+    ForgeCacheMixin,
+    PullRequestsRepositoryMixin,
 ):
     task_name = TaskName.source_git_pr_to_dist_git_pr
+    task_cost = TaskCost.heavy
 
     def __init__(
         self,
@@ -87,58 +141,131 @@ class SourceGitPRToDistGitPRHandler(
         self._dist_git_pr = None
         self._local_project: Optional[LocalProject] = None
 
+    @staticmethod
+    def is_code_change(event: dict) -> bool:
+        return event["action"] == GitlabEventAction.opened.value or bool(
+            event["action"] == GitlabEventAction.update.value and event["oldrev"]
+        )
+
+    @staticmethod
+    def sync_generation(event: dict) -> Generation:
+        return Generation("mr-sync", event["url"])
+
+    @classmethod
+    def get_signature(cls, event: Event, job: Optional[JobConfig]) -> Signature:
+        """
+        Each code change of a source-git MR starts a new generation of the sync,
+        only the newest one gets to the dist-git MR.
+        """
+        signature = super().get_signature(event=event, job=job)
+        event_dict = signature.kwargs["event"]
+        if cls.is_code_change(event_dict):
+            event_dict["sync_generation"] = cls.sync_generation(event_dict).bump()
+        return signature
+
+    def check_superseded(self):
+        """
+        Checkpoint for aborting a sync of an outdated commit.
+
+        Raises:
+            SyncSuperseded: if there's a newer code change in the source-git MR.
+        """
+        if (generation := self.data.event_dict.get("sync_generation")) is None:
+            return
+        if not self.sync_generation(self.data.event_dict).is_current(generation):
+            raise SyncSuperseded(
+                f"Not syncing {self.commit_sha} of {self.pr_url}, "
+                "there's a newer commit to sync."
+            )
+
     @property
     def source_git_pr_model(self) -> PullRequestModel:
         if not self._source_git_pr_model:
-            self._source_git_pr_model = PullRequestModel.get_or_create(
+            self._source_git_pr_model = self.db.get_pr(
+                project_url=self.project.get_web_url(),
                 pr_id=self.pr_identifier,
                 namespace=self.project.namespace,
                 repo_name=self.project.repo,
-                project_url=self.project.get_web_url(),
+                commit_sha=self.commit_sha,
             )
-            if self._source_git_pr_model:
-                ProjectEventModel.get_or_create(
-                    type=self._source_git_pr_model.project_event_model_type,
-                    event_id=self._source_git_pr_model.id,
-                    commit_sha=self.commit_sha,
-                )
         return self._source_git_pr_model
 
     @property
     def dist_git_pr_model(self) -> Optional[PullRequestModel]:
         if not self._dist_git_pr_model:
-            if sg_dg := SourceGitPRDistGitPRModel.get_by_source_git_id(
-                self.source_git_pr_model.id
-            ):
-                self._dist_git_pr_model = sg_dg.dist_git_pull_request
+            self._dist_git_pr_model = self.db.get_dist_git_pr(
+                self.source_git_pr_model.project.project_url,
+                self.source_git_pr_model.pr_id,
+            )
         return self._dist_git_pr_model
 
+    @property
+    def source_git_pr(self) -> PullRequest:
+        return self.forge_cache.get_pr(self.project, self.pr_identifier)
+
     @property
     def dist_git_pr(self) -> Optional[PullRequest]:
         if not self._dist_git_pr and self.dist_git_pr_model:
-            dist_git_project = self.service_config.get_project(
+            dist_git_project = self.forge_cache.get_project(
                 url=self.dist_git_pr_model.project.project_url
             )
-            self._dist_git_pr = dist_git_project.get_pr(self.dist_git_pr_model.pr_id)
+            self._dist_git_pr = self.forge_cache.get_pr(
+                dist_git_project, self.dist_git_pr_model.pr_id
+            )
         return self._dist_git_pr
 
     @property
     def local_project(self) -> LocalProject:
         if not self._local_project:
-            source_project = self.service_config.get_project(
-                url=self.source_project_url
-            )
-            self._local_project = LocalProjectBuilder().build(
+            source_project = self.forge_cache.get_project(url=self.source_project_url)
+            self._local_project = LocalProjectBuilder(
+                cache=get_repository_cache()
+            ).build(
                 git_project=source_project,
                 ref=self.data.commit_sha,
                 working_dir=self.service_config.command_handler_work_dir,
                 git_repo=CALCULATE,
             )
-            # We need to fetch tags from the upstream source-git repo
-            # Details: https://github.com/packit/hardly/issues/61
-            self._local_project.fetch(self.project.get_web_url(), force=True)
+            self.fetch_upstream_refs()
         return self._local_project
 
+    def upstream_refspecs(self) -> List[str]:
+        """
+        Refspecs of what's needed from the upstream source-git repo:
+        the MR target branch and the tag of the upstream release
+        the source-git repo is based on.
+        """
+        branch = self.target_repo_branch
+        refspecs = [f"+refs/heads/{branch}:refs/remotes/upstream/{branch}"]
+        if not (tag := self.package_config.upstream_ref):
+            tag = self.packit_api.up.convert_version_to_tag(
+                self.packit_api.up.get_specfile_version()
+            )
+        refspecs.append(f"+refs/tags/{tag}:refs/tags/{tag}")
+        return refspecs
+
+    def fetch_upstream_refs(self):
+        """
+        The MR comes from a fork which usually doesn't have the tags
+        the version calculation needs, fetch them from the upstream source-git repo.
+        Details: https://github.com/packit/hardly/issues/61
+        """
+        upstream_url = self.project.get_web_url()
+        if self.package_config:
+            refspecs = self.upstream_refspecs()
+            logger.debug(f"Fetching {refspecs} from {upstream_url}")
+            try:
+                self._local_project.git_repo.git.fetch(
+                    upstream_url, "--no-tags", *refspecs
+                )
+                return
+            except GitCommandError as ex:
+                # e.g. upstream_ref is not a tag
+                logger.info(f"Failed to fetch {refspecs}: {ex}")
+
+        logger.debug(f"Fetching all tags from {upstream_url}")
+        self._local_project.fetch(upstream_url, force=True)
+
     @property
     def packit_api(self):
         if not self._packit_api:
@@ -158,9 +285,16 @@ This MR has been automatically created from
 Please review the contribution and once you are comfortable with the content,
 you should trigger a CI pipeline run via `Pipelines → Run pipeline`."""
 
+        version = self.packit_api.up.get_specfile_version()
+        dist_git_project = self.forge_cache.get_project(
+            url=self.package_config.dist_git_package_url
+        )
+        throttle(dist_git_project.service, SYNC_API_CALLS)
+        # the source-git repo has been cloned, last chance before the push
+        self.check_superseded()
         return self.packit_api.sync_release(
             dist_git_branch=self.target_repo_branch,
-            version=self.packit_api.up.get_specfile_version(),
+            version=version,
             add_new_sources=False,
             title=self.pr_title,
             description=f"{fix_bz_refs(self.pr_description)}\n\n---\n{dg_pr_info}",
@@ -183,6 +317,8 @@ you should trigger a CI pipeline run via `Pipelines → Run pipeline`."""
             msg = ""
             if self.action == GitlabEventAction.closed.value:
                 msg = f"[Source-git MR]({self.pr_url}) has been closed."
+                # The link stays (in the DB and so in MRMappingCache),
+                # so that a reopened MR still has its dist-git MR.
                 self.dist_git_pr.close()
             elif self.action == GitlabEventAction.reopen.value:
                 msg = f"[Source-git MR]({self.pr_url}) has been reopened."
@@ -203,23 +339,14 @@ you should trigger a CI pipeline run via `Pipelines → Run pipeline`."""
             self.dist_git_pr.comment(msg)
         return True
 
-    def dist_git_pr_in_db(self, dg_pr: PullRequest, dg_commit_sha: str) -> bool:
-        dg_pr_model = PullRequestModel.get_or_create(
-            pr_id=dg_pr.id,
-            namespace=dg_pr.target_project.namespace,
-            repo_name=dg_pr.target_project.repo,
-            project_url=dg_pr.target_project.get_web_url(),
-        )
-        ProjectEventModel.get_or_create(
-            type=dg_pr_model.project_event_model_type,
-            event_id=dg_pr_model.id,
-            commit_sha=dg_commit_sha,
-        )
-        if sg_dg := SourceGitPRDistGitPRModel.get_by_dist_git_id(dg_pr_model.id):
+    def dist_git_pr_in_db(self, dg_pr: PullRequest) -> bool:
+        if sg_pr_model := self.db.get_source_git_pr(
+            dg_pr.target_project.get_web_url(), dg_pr.id
+        ):
             logger.error(
                 f"Packit didn't create a new dist-git MR probably because a MR (#{dg_pr.id}) "
                 "with the same title & description & target branch already exists. "
-                f"It was created from src-git MR #{sg_dg.source_git_pull_request.pr_id}."
+                f"It was created from src-git MR #{sg_pr_model.pr_id}."
             )
             return True
         return False
@@ -229,6 +356,22 @@ you should trigger a CI pipeline run via `Pipelines → Run pipeline`."""
         If user creates a merge-request on the source-git repository,
         create a matching merge-request to the dist-git repository.
         """
+        # for the CI status relays, see DistGitCIToSourceGitPRHandler.run()
+        MRMappingCache.set_head_commit(
+            self.data.project_url,
+            self.pr_identifier,
+            self.commit_sha,
+            timestamp=self.data.event_dict["created_at"],
+        )
+        try:
+            return self._run()
+        except SyncSuperseded as ex:
+            logger.info(str(ex))
+            return TaskResults(success=True)
+
+    def _run(self) -> TaskResults:
+        self.check_superseded()
+
         if self.pr_title.startswith(DISTGIT_TO_SOURCEGIT_PR_TITLE):
             logger.debug(f"{DISTGIT_TO_SOURCEGIT_PR_TITLE} PR opened by us.")
             return TaskResults(success=True)
@@ -244,29 +387,58 @@ you should trigger a CI pipeline run via `Pipelines → Run pipeline`."""
             # There already is a corresponding dist-git MR, let's update it.
             return TaskResults(success=self.handle_existing_dist_git_pr())
 
+        # Reject the MR before anything gets cloned.
+        if not self.dist_git_pr_can_be_created():
+            return TaskResults(success=True)
+
+        # Don't let concurrent events for the MR create more dist-git MRs (#70).
+        wait = int(getenv("MR_SYNC_LOCK_WAIT", MR_SYNC_LOCK_WAIT))
+        with lease("mr-sync", self.pr_url, ttl=MR_SYNC_LOCK_TTL, wait=wait) as locked:
+            if not locked:
+                # Don't drop the event, the holder might be syncing an older commit.
+                raise Deferred(
+                    f"A dist-git MR for {self.pr_url} is being created by another task.",
+                    countdown=MR_SYNC_LOCK_DEFER,
+                )
+
+            # It might have been created while we were waiting for the lock.
+            self._dist_git_pr_model = None
+            if self.dist_git_pr_model:
+                return TaskResults(success=self.handle_existing_dist_git_pr())
+
+            return self.create_dist_git_pr()
+
+    def dist_git_pr_can_be_created(self) -> bool:
+        """
+        Checks done (via API only) before a dist-git MR is created,
+        i.e. before the repos are cloned.
+        """
         if not self.package_config:
             logger.debug("No package config found.")
-            return TaskResults(success=True)
+            return False
 
-        if (
-            self.target_repo_branch
-            not in self.packit_api.dg.local_project.git_project.get_branches()
-        ):
+        dist_git_project = self.forge_cache.get_project(
+            url=self.package_config.dist_git_package_url
+        )
+        if not BranchesCache.branch_exists(dist_git_project, self.target_repo_branch):
             msg = (
                 "Can't create a dist-git pull/merge request out of this contribution "
                 f"because matching {self.target_repo_branch} branch does not exist "
                 f"in dist-git {self.target_repo} repo."
             )
-            self.project.get_pr(int(self.pr_identifier)).comment(msg)
+            self.source_git_pr.comment(msg)
             logger.info(msg)
-            return TaskResults(success=True)
+            return False
 
+        return True
+
+    def create_dist_git_pr(self) -> TaskResults:
         logger.info(f"About to create a dist-git MR from source-git MR {self.pr_url}")
 
-        dg_commit_sha = self.project.get_pr(int(self.pr_identifier)).merge_commit_sha
+        dg_commit_sha = self.source_git_pr.merge_commit_sha
         dg_pr = self.sync_release()
         # This check is probably not needed, it's here in case the #70 appears again.
-        if self.dist_git_pr_in_db(dg_pr, dg_commit_sha):
+        if self.dist_git_pr_in_db(dg_pr):
             return TaskResults(success=False)
 
         comment = f"""[Dist-git MR #{dg_pr.id}]({dg_pr.url})
@@ -274,32 +446,23 @@ has been created for sake of triggering the downstream checks.
 It ensures that your contribution is valid and can be incorporated in
 dist-git as it is still the authoritative source for the distribution.
 We want to run checks there only so they don't need to be reimplemented in source-git as well."""
-        self.project.get_pr(int(self.pr_identifier)).comment(comment)
+        self.source_git_pr.comment(comment)
 
-        SourceGitPRDistGitPRModel.get_or_create(
-            self.pr_identifier,
-            self.project.namespace,
-            self.project.repo,
-            self.project.get_web_url(),
-            dg_pr.id,
-            dg_pr.target_project.namespace,
-            dg_pr.target_project.repo,
-            dg_pr.target_project.get_web_url(),
+        dg_pr_model = self.db.get_pr(
+            project_url=dg_pr.target_project.get_web_url(),
+            pr_id=dg_pr.id,
+            namespace=dg_pr.target_project.namespace,
+            repo_name=dg_pr.target_project.repo,
+            commit_sha=dg_commit_sha,
         )
+        self.db.link(self.source_git_pr_model, dg_pr_model)
 
         return TaskResults(success=True)
 
     def handle_target(self) -> bool:
         """Tell if a target repo and branch pair of an MR should be handled or ignored."""
-        handled_targets = self.service_config.gitlab_mr_targets_handled
-
-        # If nothing is configured, all targets are handled.
-        if not handled_targets:
-            return True
-
-        for target in handled_targets:
-            if re.fullmatch(target.repo or ".+", self.target_repo) and re.fullmatch(
-                target.branch or ".+", self.target_repo_branch
-            ):
-                return True
-        return False
+        return is_target_handled(
+            self.service_config.gitlab_mr_targets_handled,
+            self.target_repo,
+            self.target_repo_branch,
+        )
@@ -0,0 +1,178 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Worker-wide cache of the forges' responses to GET requests.
+
+Cached responses are never used without asking the forge: each request
+is made conditional (If-None-Match/If-Modified-Since) and if the forge
+responds with 304 Not Modified, the cached response is returned.
+That's faster and cheaper (rate limits) than getting the whole response again.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import sha256
+from logging import getLogger
+from os import getenv
+from threading import Lock
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from hardly.constants import HTTP_CACHE_SIZE
+from hardly.monitoring import http_cache_lookups
+
+logger = getLogger(__name__)
+
+# The responses differ for different accounts
+AUTH_HEADERS = ("Authorization", "PRIVATE-TOKEN")
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: CaseInsensitiveDict
+    content: bytes
+    encoding: Optional[str]
+    reason: str
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+
+class ResponseCache:
+    """LRU of the responses, limited by their total size (bytes)."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self._responses: OrderedDict = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(request: requests.PreparedRequest) -> str:
+        auth = "\n".join(request.headers.get(header, "") for header in AUTH_HEADERS)
+        return f"{request.url}#{sha256(auth.encode()).hexdigest()}"
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            if (response := self._responses.get(key)) is not None:
+                self._responses.move_to_end(key)
+            return response
+
+    def set(self, key: str, response: CachedResponse):
+        with self._lock:
+            if (old := self._responses.pop(key, None)) is not None:
+                self.size -= old.size
+            if response.size > self.max_size:
+                return
+            self._responses[key] = response
+            self.size += response.size
+            while self.size > self.max_size:
+                _, evicted = self._responses.popitem(last=False)
+                self.size -= evicted.size
+
+    def delete(self, key: str):
+        with self._lock:
+            if (old := self._responses.pop(key, None)) is not None:
+                self.size -= old.size
+
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> ResponseCache:
+    """The cache shared by the sessions of all the forges."""
+    max_size = int(getenv("HTTP_CACHE_SIZE", HTTP_CACHE_SIZE))
+    return ResponseCache(max_size=max_size * 1024**2)
+
+
+class CachingHTTPAdapter(HTTPAdapter):
+    """Transport adapter revalidating cached responses to GET requests."""
+
+    def __init__(self, cache: ResponseCache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    @staticmethod
+    def _is_cacheable(response: requests.Response) -> bool:
+        return (
+            response.status_code == 200
+            and ("ETag" in response.headers or "Last-Modified" in response.headers)
+            and "no-store" not in response.headers.get("Cache-Control", "")
+        )
+
+    def _build_cached_response(
+        self, request: requests.PreparedRequest, cached: CachedResponse, not_modified
+    ) -> requests.Response:
+        response = requests.Response()
+        response.status_code = cached.status_code
+        response.headers = CaseInsensitiveDict(cached.headers)
+        # e.g. the rate limit headers are fresh
+        response.headers.update(not_modified.headers)
+        response._content = cached.content
+        response.encoding = cached.encoding
+        response.reason = cached.reason
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.elapsed = not_modified.elapsed
+        return response
+
+    def send(self, request: requests.PreparedRequest, stream=False, **kwargs):
+        if request.method != "GET" or stream or "Range" in request.headers:
+            if request.method != "GET":
+                # the resource is most likely changed
+                self.cache.delete(self.cache.key(request))
+            return super().send(request, stream=stream, **kwargs)
+
+        key = self.cache.key(request)
+        if cached := self.cache.get(key):
+            request = request.copy()
+            if etag := cached.headers.get("ETag"):
+                request.headers["If-None-Match"] = etag
+            if last_modified := cached.headers.get("Last-Modified"):
+                request.headers["If-Modified-Since"] = last_modified
+
+        response = super().send(request, stream=stream, **kwargs)
+
+        if cached and response.status_code == 304:
+            http_cache_lookups.labels(result="hit").inc()
+            return self._build_cached_response(request, cached, response)
+
+        http_cache_lookups.labels(result="miss").inc()
+        if self._is_cacheable(response):
+            self.cache.set(
+                key,
+                CachedResponse(
+                    status_code=response.status_code,
+                    headers=CaseInsensitiveDict(response.headers),
+                    # reads the whole (not streamed) response
+                    content=response.content,
+                    encoding=response.encoding,
+                    reason=response.reason,
+                ),
+            )
+        return response
+
+
+def mount_response_cache(session: requests.Session, **adapter_kwargs):
+    """
+    Make the session use the response cache, keeping its adapters' settings.
+
+    Args:
+        adapter_kwargs: Override the settings, e.g. pool_maxsize.
+    """
+    for prefix in ("https://", "http://"):
+        adapter = session.get_adapter(prefix)
+        kwargs = {
+            "max_retries": adapter.max_retries,
+            "pool_connections": adapter._pool_connections,
+            "pool_maxsize": adapter._pool_maxsize,
+            "pool_block": adapter._pool_block,
+        }
+        kwargs.update(adapter_kwargs)
+        session.mount(prefix, CachingHTTPAdapter(get_response_cache(), **kwargs))
@@ -2,17 +2,48 @@
 # SPDX-License-Identifier: MIT
 
 from logging import getLogger
-from typing import List, Set, Type, Optional
+from typing import Iterable, List, Set, Tuple, Type, Optional
 
-from hardly.handlers.abstract import SUPPORTED_EVENTS_FOR_HANDLER
+from celery import group
+from celery.canvas import Signature
+
+from hardly.cache import BranchesCache
+from hardly.handlers.abstract import get_handlers_for_event_class
+from hardly.handlers.sourcegitPR_to_distgitPR import is_target_handled
+from hardly.routing import get_queue
 from packit.utils import nested_get
-from packit_service.worker.events import Event
+from packit_service.config import ServiceConfig
+from packit_service.worker.events import (
+    Event,
+    MergeRequestGitlabEvent,
+    PushGitlabEvent,
+    PushPagureEvent,
+)
 from packit_service.worker.handlers import JobHandler
 from packit_service.worker.parser import Parser
 from packit_service.worker.result import TaskResults
 
 logger = getLogger(__name__)
 
+ZERO_SHA = "0" * 40
+
+
+def get_branch_change_project(event: dict) -> Optional[str]:
+    """
+    URL of the project a GitLab push webhook creates/deletes a branch of.
+
+    The parser drops such pushes (they have no commits), unless
+    a created branch has new commits, so see them in the raw payload.
+    Pagure doesn't send any message for a deleted branch at all.
+    """
+    if event.get("object_kind") != "push" or not str(event.get("ref")).startswith(
+        "refs/heads/"
+    ):
+        return None
+    if ZERO_SHA not in (event.get("before"), event.get("after")):
+        return None
+    return nested_get(event, "project", "web_url")
+
 
 class StreamJobs:
     """
@@ -24,27 +55,21 @@ class StreamJobs:
         self.event = event
 
     def get_handlers_for_event(self) -> Set[Type[JobHandler]]:
-        matching_handlers = {
-            handler
-            for handler in SUPPORTED_EVENTS_FOR_HANDLER.keys()
-            if isinstance(self.event, tuple(SUPPORTED_EVENTS_FOR_HANDLER[handler]))
-        }
+        matching_handlers = set(get_handlers_for_event_class(self.event.__class__))
         if not matching_handlers:
             logger.debug(f"No handler found for event:\n{self.event.__class__}")
         logger.debug(f"Matching handlers: {matching_handlers}")
 
         return matching_handlers
 
-    def process_message(
+    def get_signatures(
         self,
         event: dict,
         source: Optional[str] = None,
         event_type: Optional[str] = None,
-    ) -> List[TaskResults]:
+    ) -> List[Signature]:
         """
-        Entrypoint for message processing.
-
-        For values of 'source' and 'event_type' see Parser.MAPPING.
+        Parse the event and get signatures of tasks of all the matching handlers.
 
         Args:
             event: Dict with webhook/fed-msg payload.
@@ -52,8 +77,11 @@ class StreamJobs:
             event_type: Type of the event.
 
         Returns:
-            List of results of the processing tasks.
+            Signatures of the handler tasks, not sent yet.
         """
+        if project_url := get_branch_change_project(event):
+            BranchesCache.invalidate(project_url)
+
         parser = nested_get(
             Parser.MAPPING, source, event_type, default=Parser.parse_event
         )
@@ -61,10 +89,91 @@ class StreamJobs:
         if not (self.event and self.event.pre_check()):
             return []
 
+        if isinstance(self.event, MergeRequestGitlabEvent) and not is_target_handled(
+            ServiceConfig.get_service_config().gitlab_mr_targets_handled,
+            f"{self.event.target_repo_namespace}/{self.event.target_repo_name}",
+            self.event.target_repo_branch,
+        ):
+            logger.debug(
+                f"Not handling MR {self.event.url} targeting "
+                f"{self.event.target_repo_namespace}/{self.event.target_repo_name}:"
+                f"{self.event.target_repo_branch}"
+            )
+            return []
+
+        if isinstance(self.event, (PushGitlabEvent, PushPagureEvent)):
+            BranchesCache.update_on_push(
+                project_url=self.event.project_url, branch=self.event.git_ref
+            )
+
+        signatures = []
         for handler_class in self.get_handlers_for_event():
-            handler_class.get_signature(
-                event=self.event,
-                job=None,
-            ).apply_async()
+            # a handler can decide there's nothing to run for the event
+            if signature := handler_class.get_signature(event=self.event, job=None):
+                signatures.append(
+                    signature.set(queue=get_queue(handler_class, self.event))
+                )
+        return signatures
+
+    def process_message(
+        self,
+        event: dict,
+        source: Optional[str] = None,
+        event_type: Optional[str] = None,
+    ) -> List[TaskResults]:
+        """
+        Entrypoint for message processing.
+
+        For values of 'source' and 'event_type' see Parser.MAPPING.
+
+        Args:
+            event: Dict with webhook/fed-msg payload.
+            source: Source of the event, for example: "gitlab".
+            event_type: Type of the event.
+
+        Returns:
+            List of results of the processing tasks.
+        """
+        for signature in self.get_signatures(
+            event=event, source=source, event_type=event_type
+        ):
+            signature.apply_async()
+
+        return []
+
+    def process_messages(
+        self, messages: Iterable[Tuple[dict, Optional[str], Optional[str]]]
+    ) -> List[TaskResults]:
+        """
+        Entrypoint for processing a batch of messages.
+
+        All the handler tasks are sent as a single group,
+        i.e. in one round trip to the broker instead of one per task.
+        A message which can't be processed is logged and skipped,
+        so that it doesn't take the rest of the batch down with it.
+
+        Args:
+            messages: (event, source, event_type) tuples,
+                see process_message() for their meaning.
+
+        Returns:
+            List of results of the processing tasks.
+        """
+        signatures = []
+        for event, source, event_type in messages:
+            try:
+                signatures.extend(
+                    self.get_signatures(
+                        event=event, source=source, event_type=event_type
+                    )
+                )
+            except Exception as ex:
+                logger.exception(
+                    f"Skipping a {source} {event_type} message of the batch: {ex!r}"
+                )
+
+        logger.debug(f"Sending {len(signatures)} tasks as a group.")
+        if signatures:
+            group(signatures).apply_async()
 
         return []
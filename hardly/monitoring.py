@@ -0,0 +1,83 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Metrics of hardly, pushed to the Pushgateway the same way as packit-service's ones.
+"""
+
+from logging import getLogger
+from os import getenv
+from threading import Event, Thread
+
+from celery.utils.log import current_process_index
+from prometheus_client import CollectorRegistry, Counter, pushadd_to_gateway
+
+logger = getLogger(__name__)
+
+registry = CollectorRegistry()
+
+forge_cache_lookups = Counter(
+    "hardly_forge_cache_lookups",
+    "Lookups of git-forge projects/PRs in the per-task cache",
+    ["kind", "result"],
+    registry=registry,
+)
+
+http_cache_lookups = Counter(
+    "hardly_http_cache_lookups",
+    "GET requests to the forges: hit (revalidated cached response) or miss",
+    ["result"],
+    registry=registry,
+)
+
+task_outcomes = Counter(
+    "hardly_task_outcomes",
+    "Outcomes of the handler tasks: succeeded, retried, failed (permanent error), "
+    "exhausted (out of retries) or deferred (circuit breaker open)",
+    ["task", "outcome"],
+    registry=registry,
+)
+
+
+def push_metrics():
+    pushgateway_address = getenv("PUSHGATEWAY_ADDRESS", "")
+    # so that workers don't overwrite each other's metrics,
+    # the job name corresponds to worker name (e.g. hardly-worker-0)
+    worker_name = getenv("HOSTNAME")
+    if not (pushgateway_address and worker_name):
+        return
+    # and each (prefork) process of the worker has its own group,
+    # a process replacing a recycled one takes over its index
+    process_index = current_process_index(base=0)
+    grouping_key = {"process": "main" if process_index is None else str(process_index)}
+    try:
+        # pushadd, not to remove packit-service's metrics of the same job
+        pushadd_to_gateway(
+            pushgateway_address,
+            job=worker_name,
+            grouping_key=grouping_key,
+            registry=registry,
+        )
+    except OSError as ex:
+        logger.info(f"Failed to push metrics: {ex}")
+
+
+class MetricsPusher(Thread):
+    """
+    Pushes the metrics of the worker process every `interval` seconds
+    in the background, so that the tasks don't wait for the Pushgateway.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__(name="metrics-pusher", daemon=True)
+        self.interval = interval
+        self._stopped = Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            push_metrics()
+
+    def stop(self):
+        """Stop pushing periodically and push the final values."""
+        self._stopped.set()
+        push_metrics()
@@ -0,0 +1,160 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Budgets of the git-forge API calls, shared by all the workers.
+
+Each (forge host, account) pair has a token bucket in Redis, which the handlers
+take tokens from before their API-heavy stages. A stage waits when the bucket
+is empty, so that bursts of tasks don't run into the forge's rate limits.
+The remaining quota the forges report in the response headers
+drains the bucket, in case the account is used by something else as well.
+"""
+
+from functools import lru_cache
+from hashlib import sha256
+from logging import getLogger
+from math import ceil
+from os import getenv
+from time import sleep
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+
+from hardly.constants import FORGE_API_BURST, FORGE_API_MAX_WAIT, FORGE_API_RATE
+from hardly.errors import Deferred
+from hardly.store import get_redis, make_key
+from ogr.abstract import GitService
+
+logger = getLogger(__name__)
+
+# Seconds after which an unused bucket is removed (i.e. is full again)
+BUCKET_TTL = 60 * 60
+
+# Refill the bucket since its last use and take the tokens from it, even if it
+# goes negative, i.e. reserve them. Returns the seconds to wait for the reserved
+# tokens, nothing is reserved if it's more than the max. wait.
+ACQUIRE = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local requested, max_wait = tonumber(ARGV[3]), tonumber(ARGV[4])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(state[1]) or burst
+local timestamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate)
+local wait = math.max(0, requested - tokens) / rate
+if wait <= max_wait then
+    tokens = tokens - requested
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return tostring(wait)
+"""
+
+# Don't let the bucket have more tokens than the quota the forge reports,
+# when the quota is exhausted, make the bucket empty until the quota resets.
+OBSERVE_QUOTA = """
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local remaining, reset = tonumber(ARGV[3]), tonumber(ARGV[4])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'timestamp')
+local tokens = tonumber(state[1]) or burst
+local timestamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - timestamp) * rate, remaining)
+if remaining == 0 and reset > now then
+    tokens = math.min(tokens, -(reset - now) * rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'timestamp', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+return 1
+"""
+
+
+class RateLimitExceeded(Deferred):
+    """
+    The API budget is exhausted for longer than we're willing to wait.
+
+    It's not a failure of the forge, the task is just run again
+    once the budget is available, see HandlerTaskWithRetry.
+    """
+
+
+@lru_cache(maxsize=None)
+def get_budgets() -> Dict[str, Tuple[float, int]]:
+    """
+    Budgets of the hosts set in FORGE_API_RATE_LIMITS,
+    e.g. "gitlab.com=10/300,src.fedoraproject.org=2/50" (calls per second/burst).
+    """
+    budgets = {}
+    for budget in filter(None, getenv("FORGE_API_RATE_LIMITS", "").split(",")):
+        host, limits = budget.strip().split("=")
+        rate, burst = limits.split("/")
+        budgets[host] = float(rate), int(burst)
+    return budgets
+
+
+class TokenBucket:
+    def __init__(self, host: str, account: str):
+        self.host = host
+        self.rate, self.burst = get_budgets().get(
+            host,
+            (
+                float(getenv("FORGE_API_RATE", FORGE_API_RATE)),
+                int(getenv("FORGE_API_BURST", FORGE_API_BURST)),
+            ),
+        )
+        self.key = make_key("api-budget", host, account)
+
+    @classmethod
+    def for_service(cls, service: GitService) -> "TokenBucket":
+        host = urlparse(service.instance_url).hostname
+        # don't let the token leak into Redis
+        token = getattr(service, "token", None)
+        account = sha256(token.encode()).hexdigest()[:16] if token else "anonymous"
+        return cls(host, account)
+
+    def _run(self, script: str, *args) -> str:
+        return get_redis().register_script(script)(
+            keys=[self.key], args=[self.rate, self.burst, *args, BUCKET_TTL]
+        )
+
+    def acquire(self, calls: int = 1, max_wait: Optional[int] = None):
+        """
+        Take tokens for the API calls, wait until they're available.
+
+        Raises:
+            RateLimitExceeded: if they're not available even after max_wait seconds.
+        """
+        if max_wait is None:
+            max_wait = int(getenv("FORGE_API_MAX_WAIT", FORGE_API_MAX_WAIT))
+        wait = float(self._run(ACQUIRE, calls, max_wait))
+        if wait > max_wait:
+            raise RateLimitExceeded(
+                f"the API budget of {self.host} is exhausted for {wait:.0f}s",
+                countdown=ceil(wait),
+            )
+        if wait > 0:
+            logger.debug(f"Waiting {wait:.1f}s for the API budget of {self.host}.")
+            sleep(wait)
+
+    def observe_quota(self, response: requests.Response, *args, **kwargs):
+        """
+        Response hook draining the bucket according to the remaining quota
+        reported by the forge (GitLab's RateLimit-* headers).
+        """
+        if (remaining := response.headers.get("RateLimit-Remaining")) is None:
+            return
+        reset = response.headers.get("RateLimit-Reset", 0)
+        try:
+            self._run(OBSERVE_QUOTA, int(remaining), int(reset))
+        except Exception as ex:
+            # never fail the API call because of this
+            logger.debug(f"Failed to update the API budget of {self.host}: {ex!r}")
+
+
+def throttle(service: GitService, calls: int = 1):
+    """Wait for the API budget for the calls to the service."""
+    TokenBucket.for_service(service).acquire(calls)
@@ -0,0 +1,106 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""
+Routing of the handler tasks to queues.
+
+Each handler's task goes to the queue of its cost class (TaskCost),
+so that cheap status relays don't wait for heavy syncs.
+
+Heavy tasks working with the same package (source-git & dist-git repo) are sent to
+the same worker queue, so that they reuse the worker's local clones & caches.
+The queues are configured in AFFINITY_QUEUES (comma-separated names) and each
+worker consumes some of them, each queue is consumed by one worker,
+even if there are fewer workers than queues (see files/run_worker.sh).
+
+Packages are assigned to the queues by consistent hashing, so when a queue
+is added to/removed from AFFINITY_QUEUES, only the packages of that queue
+(roughly 1/N of all) move to another queue. When removing a queue, remove it
+from AFFINITY_QUEUES first and let its consumer drain it.
+
+The queues are assigned to the workers by their index modulo WORKER_REPLICAS
+though, so changing the number of the worker pods reshuffles which worker
+consumes which queue (and the warm clones are mostly lost). WORKER_REPLICAS
+has to be the same on all the pods, so scaling the workers needs a coordinated
+rollout of all of them with the new value.
+"""
+
+from bisect import bisect
+from functools import lru_cache
+from hashlib import sha256
+from logging import getLogger
+from os import getenv
+from typing import Iterable, Optional, Tuple, Type
+
+from hardly.handlers.abstract import TaskCost
+from ogr.parsing import RepoUrl
+from packit_service.worker.events import Event
+from packit_service.worker.handlers import JobHandler
+
+logger = getLogger(__name__)
+
+
+class HashRing:
+    """Consistent hashing of keys to nodes."""
+
+    def __init__(self, nodes: Iterable[str], replicas: int = 100):
+        """
+        Args:
+            nodes: Names of the nodes.
+            replicas: Number of points per node on the ring,
+                the more the more evenly the keys are distributed.
+        """
+        self._ring = sorted(
+            (self._hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._hashes = [hash_ for hash_, _ in self._ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(sha256(key.encode()).digest()[:8], "big")
+
+    def get_node(self, key: str) -> Optional[str]:
+        if not self._ring:
+            return None
+        index = bisect(self._hashes, self._hash(key)) % len(self._ring)
+        return self._ring[index][1]
+
+
+@lru_cache(maxsize=None)
+def _get_ring(queues: Tuple[str, ...]) -> HashRing:
+    return HashRing(queues)
+
+
+def get_affinity_key(event: Event) -> Optional[str]:
+    """
+    Package name, i.e. the repo name, which is the same in source-git
+    & dist-git, so that syncs in both directions end up in the same queue.
+    """
+    if not (project_url := getattr(event, "project_url", None)):
+        return None
+    parsed = RepoUrl.parse(project_url)
+    return parsed.repo if parsed else None
+
+
+def get_affinity_queue(event: Event) -> Optional[str]:
+    queues = tuple(
+        queue.strip()
+        for queue in getenv("AFFINITY_QUEUES", "").split(",")
+        if queue.strip()
+    )
+    if not (queues and (key := get_affinity_key(event))):
+        return None
+    queue = _get_ring(queues).get_node(key)
+    logger.debug(f"Routing tasks for {key} to {queue}")
+    return queue
+
+
+def get_queue(handler_class: Type[JobHandler], event: Event) -> str:
+    """Queue to send the handler's task to."""
+    if handler_class.task_cost == TaskCost.heavy and (
+        queue := get_affinity_queue(event)
+    ):
+        return queue
+    return handler_class.task_cost.value
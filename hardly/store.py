@@ -0,0 +1,156 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+"""State shared by all the workers, kept in the Redis we use as a Celery broker."""
+
+from contextlib import contextmanager
+from functools import lru_cache
+from logging import getLogger
+from os import getenv
+from threading import Event, Thread
+from typing import Iterator, Optional, Tuple
+
+from redis import Redis
+from redis.exceptions import LockError, RedisError
+from redis.lock import Lock
+
+logger = getLogger(__name__)
+
+KEY_PREFIX = "hardly"
+
+
+@lru_cache(maxsize=None)
+def get_redis() -> Redis:
+    return Redis(
+        host=getenv("REDIS_SERVICE_HOST", "redis"),
+        port=int(getenv("REDIS_SERVICE_PORT", "6379")),
+        db=int(getenv("REDIS_SERVICE_DB", "0")),
+        password=getenv("REDIS_PASSWORD") or None,
+        decode_responses=True,
+    )
+
+
+def make_key(*parts) -> str:
+    return ":".join((KEY_PREFIX, *(str(part) for part in parts)))
+
+
+def _renew(lock: Lock, ttl: int, released: Event):
+    """Keep extending the lock until it's released."""
+    while not released.wait(ttl / 3):
+        try:
+            lock.reacquire()
+        except LockError:
+            logger.warning(f"{lock.name} expired before it has been renewed.")
+            return
+        except RedisError as ex:
+            logger.info(f"Failed to renew {lock.name}: {ex!r}")
+
+
+@contextmanager
+def lease(*key_parts, ttl: int, wait: int) -> Iterator[bool]:
+    """
+    Lock shared by all the workers, which expires after some time
+    in case its holder doesn't release it (e.g. because it has been killed).
+    While the holder runs, the lock is renewed in the background,
+    so it can be held for longer than the ttl.
+
+    Args:
+        key_parts: Identify the lock.
+        ttl: Seconds after which the lock expires unless renewed.
+        wait: Seconds to wait for the lock, 0 not to wait at all.
+
+    Yields:
+        Whether the lock has been acquired.
+    """
+    lock = get_redis().lock(
+        make_key("lock", *key_parts),
+        timeout=ttl,
+        blocking=bool(wait),
+        blocking_timeout=wait or None,
+        # it's renewed from another thread
+        thread_local=False,
+    )
+    if not lock.acquire():
+        yield False
+        return
+    released = Event()
+    Thread(target=_renew, args=(lock, ttl, released), daemon=True).start()
+    try:
+        yield True
+    finally:
+        released.set()
+        try:
+            lock.release()
+        except LockError:
+            logger.warning(f"{lock.name} expired before it has been released.")
+
+
+class Generation:
+    """
+    Counter telling which one of related events is the newest one.
+
+    Each new event bumps the counter and remembers the value it got,
+    a task processing the event can later check whether
+    there has been a newer event in the meantime.
+    """
+
+    def __init__(self, *key_parts, ttl: int = 24 * 60 * 60):
+        self.key = make_key("generation", *key_parts)
+        self.ttl = ttl
+
+    def bump(self) -> int:
+        with get_redis().pipeline() as pipe:
+            pipe.incr(self.key)
+            pipe.expire(self.key, self.ttl)
+            generation, _ = pipe.execute()
+        return generation
+
+    def current(self) -> int:
+        return int(get_redis().get(self.key) or 0)
+
+    def is_current(self, generation: int) -> bool:
+        return generation == self.current()
+
+
+class VersionedState:
+    """
+    Last-writer-wins register: a state is stored only when its version
+    is not older than the version of the already stored one.
+
+    The version is a (timestamp, order) pair, the order breaks ties
+    of events with the same timestamp.
+    """
+
+    SET_IF_NEWER = """
+local current = redis.call('HMGET', KEYS[1], 'timestamp', 'order')
+if current[1] then
+    local timestamp, order = tonumber(ARGV[1]), tonumber(ARGV[2])
+    local current_timestamp, current_order = tonumber(current[1]), tonumber(current[2])
+    if timestamp < current_timestamp
+        or (timestamp == current_timestamp and order < current_order) then
+        return 0
+    end
+end
+redis.call('HSET', KEYS[1], 'timestamp', ARGV[1], 'order', ARGV[2], 'state', ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+    def __init__(self, *key_parts, ttl: int = 7 * 24 * 60 * 60):
+        self.key = make_key("state", *key_parts)
+        self.ttl = ttl
+
+    def set_if_newer(self, version: Tuple[int, int], state: str) -> bool:
+        """
+        Store the state unless a newer one has already been stored.
+
+        Returns:
+            Whether the state has been stored, i.e. it's the latest one.
+        """
+        script = get_redis().register_script(self.SET_IF_NEWER)
+        timestamp, order = version
+        return bool(script(keys=[self.key], args=[timestamp, order, state, self.ttl]))
+
+    def get(self) -> Optional[str]:
+        """The stored state, if any."""
+        return get_redis().hget(self.key, "state")
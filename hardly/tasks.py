@@ -1,15 +1,31 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
+import json
 import logging
+from hashlib import sha256
 from os import getenv
 from socket import gaierror
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+import requests
 from celery import Task
-from celery.signals import after_setup_logger
+from celery.exceptions import Ignore, Retry
+from celery.signals import (
+    after_setup_logger,
+    task_prerun,
+    worker_process_init,
+    worker_process_shutdown,
+)
 from syslog_rfc5424_formatter import RFC5424Formatter
 
+from hardly.cache import LRUCache, MissingProjectsCache
+from hardly.constants import (
+    CONFIGS_CACHE_SIZE,
+    FORGE_POOL_SIZE,
+    FORGE_WARM_UP_TIMEOUT,
+    METRICS_PUSH_INTERVAL,
+)
 from hardly.handlers import (
     SourceGitPRToDistGitPRHandler,
     GitlabCIToSourceGitPRHandler,
@@ -18,7 +34,23 @@ from hardly.handlers import (
 )
 from hardly.handlers.abstract import TaskName
 from hardly.jobs import StreamJobs
+from hardly.circuit_breaker import (
+    CircuitBreaker,
+    Permit,
+    forget_failed_responses,
+    get_failing_host,
+    observe_response,
+)
+from hardly.errors import Deferred, is_transient_error
+from hardly.forge import SessionsSetup
+from hardly.http_cache import mount_response_cache
+from hardly.monitoring import MetricsPusher, task_outcomes
+from hardly.rate_limit import TokenBucket
+from ogr.abstract import GitService
+from packit.config.job_config import JobConfig
+from packit.config.package_config import PackageConfig
 from packit_service.celerizer import celery_app
+from packit_service.config import ServiceConfig
 from packit_service.constants import (
     DEFAULT_RETRY_LIMIT,
     DEFAULT_RETRY_BACKOFF,
@@ -72,6 +104,65 @@ def setup_loggers(logger, *args, **kwargs):
         logger.addHandler(handler)
 
 
+_metrics_pusher: Optional[MetricsPusher] = None
+
+
+@worker_process_init.connect
+def start_pushing_metrics(*args, **kwargs):
+    global _metrics_pusher
+    _metrics_pusher = MetricsPusher(
+        float(getenv("METRICS_PUSH_INTERVAL", METRICS_PUSH_INTERVAL))
+    )
+    _metrics_pusher.start()
+
+
+@worker_process_shutdown.connect
+def stop_pushing_metrics(*args, **kwargs):
+    if _metrics_pusher:
+        _metrics_pusher.stop()
+
+
+def configure_forge_session(service: GitService, session: requests.Session):
+    """
+    Let the forges' responses update our API budgets, see rate_limit.py,
+    and the circuit breakers, see circuit_breaker.py,
+    and revalidate the cached ones, see http_cache.py.
+
+    The sessions (and their connection pools) live as long as the worker process,
+    i.e. the connections are reused by all its tasks. FORGE_POOL_SIZE limits
+    the connections kept alive, not the ones open at once, so that a task
+    never blocks waiting for a connection. New adapters are mounted,
+    so no connection opened before the process has been forked is reused.
+    """
+    pool_size = int(getenv("FORGE_POOL_SIZE", FORGE_POOL_SIZE))
+    mount_response_cache(session, pool_maxsize=pool_size)
+    session.hooks["response"].extend(
+        [TokenBucket.for_service(service).observe_quota, observe_response]
+    )
+
+
+_sessions_setup: Optional[SessionsSetup] = None
+
+
+@worker_process_init.connect
+def setup_forge_sessions(*args, **kwargs):
+    # In the background, Celery kills a process which doesn't start
+    # within worker_proc_alive_timeout (4s by default).
+    global _sessions_setup
+    _sessions_setup = SessionsSetup(
+        ServiceConfig.get_service_config().services, configure_forge_session
+    )
+    _sessions_setup.start()
+
+
+@task_prerun.connect
+def wait_for_forge_sessions(*args, **kwargs):
+    if _sessions_setup:
+        _sessions_setup.wait(
+            float(getenv("FORGE_WARM_UP_TIMEOUT", FORGE_WARM_UP_TIMEOUT))
+        )
+
+
 # Don't import this (or anything) from p_s.worker.tasks,
 # it would create the task from their process_message()
 class HandlerTaskWithRetry(Task):
@@ -81,6 +172,80 @@ class HandlerTaskWithRetry(Task):
     }
     retry_backoff = int(getenv("CELERY_RETRY_BACKOFF", DEFAULT_RETRY_BACKOFF))
 
+    def _defer(self, countdown: int, reason: str):
+        logger.info(f"Deferring {self.name} by {countdown}s, {reason}.")
+        self.signature_from_request().apply_async(countdown=countdown)
+        task_outcomes.labels(task=self.name, outcome="deferred").inc()
+        raise Ignore()
+
+    def __call__(self, *args, **kwargs):
+        """
+        Run the task unless the circuit breaker of the event's forge host is open,
+        run it again later if the handler says so, see Deferred.
+        """
+        breaker = CircuitBreaker.for_event(kwargs.get("event"))
+        permit = None
+        # don't defer direct (synchronous) calls
+        if not self.request.called_directly and breaker:
+            if (permit := breaker.allow()) == Permit.denied:
+                self._defer(
+                    breaker.retry_after(),
+                    f"the circuit breaker of {breaker.host} is open",
+                )
+            forget_failed_responses()
+
+        try:
+            result = super().__call__(*args, **kwargs)
+        except Deferred as ex:
+            if permit is not None:
+                breaker.record(success=True, permit=permit)
+            if self.request.called_directly:
+                raise
+            self._defer(ex.countdown, str(ex))
+        except Exception as ex:
+            if permit is not None:
+                error = ex.exc if isinstance(ex, Retry) else ex
+                self._record_failure(breaker, permit, error)
+            raise
+        if permit is not None:
+            breaker.record(success=True, permit=permit)
+        return result
+
+    @staticmethod
+    def _record_failure(breaker: CircuitBreaker, permit: Permit, error: Exception):
+        """Charge a transient error to the host that has failed."""
+        if not is_transient_error(error):
+            breaker.record(success=True, permit=permit)
+            return
+        host = get_failing_host(error) or breaker.host
+        if host == breaker.host:
+            breaker.record(success=False, permit=permit)
+            return
+        # e.g. the source-git forge a dist-git pipeline status is reported to
+        logger.debug(f"Charging {error!r} to {host} instead of {breaker.host}.")
+        breaker.record(success=True, permit=permit)
+        CircuitBreaker(host).record(success=False, permit=Permit.allowed)
+
+    def retry(self, *args, exc: Optional[BaseException] = None, **kwargs):
+        """Retry only the tasks failed because of a transient error, see autoretry_for."""
+        if isinstance(exc, Deferred):
+            # not a failure, see __call__()
+            raise exc
+        if exc is not None and not is_transient_error(exc):
+            logger.info(f"Not retrying {self.name}, {exc!r} is not a transient error.")
+            task_outcomes.labels(task=self.name, outcome="failed").inc()
+            raise exc
+
+        max_retries = kwargs.get("max_retries", self.max_retries)
+        if max_retries is not None and self.request.retries >= max_retries:
+            task_outcomes.labels(task=self.name, outcome="exhausted").inc()
+        else:
+            task_outcomes.labels(task=self.name, outcome="retried").inc()
+        return super().retry(*args, exc=exc, **kwargs)
+
+    def on_success(self, retval, task_id, args, kwargs):
+        task_outcomes.labels(task=self.name, outcome="succeeded").inc()
+
 
 @celery_app.task(
     name=getenv("CELERY_MAIN_TASK_NAME") or CELERY_DEFAULT_MAIN_TASK_NAME, bind=True
@@ -106,16 +271,44 @@ def hardly_process(
     )
 
 
+@celery_app.task(name=getenv("CELERY_BATCH_TASK_NAME", "task.hardly_process_batch"))
+def hardly_process_batch(
+    messages: List[Tuple[dict, Optional[str], Optional[str]]]
+) -> List[TaskResults]:
+    """
+    Celery task for processing a batch of messages at once.
+
+    Args:
+        messages: (event, source, event_type) tuples,
+            see hardly_process() for their meaning.
+
+    Returns:
+        task results
+    """
+    return StreamJobs().process_messages(messages)
+
+
+@celery_app.task(name="task.hardly_refresh_missing_projects")
+def hardly_refresh_missing_projects(project_url: Optional[str] = None) -> int:
+    """
+    Forget that a project (e.g. a newly created source-git repo) doesn't exist.
+
+    Args:
+        project_url: URL of the project, all of them if not set.
+
+    Returns:
+        Number of forgotten projects.
+    """
+    return MissingProjectsCache.refresh(project_url)
+
+
 @celery_app.task(name=TaskName.source_git_pr_to_dist_git_pr, base=HandlerTaskWithRetry)
 def run_source_git_pr_to_dist_git_pr_handler(
     event: dict, package_config: dict, job_config: dict
 ):
-    job_config_obj = load_job_config(job_config)
-    packages_config_obj = load_package_config(package_config)
+    package_config_obj, job_config_obj = load_configs(package_config, job_config)
     handler = SourceGitPRToDistGitPRHandler(
-        package_config=packages_config_obj.get_package_config_for(job_config_obj)
-        if packages_config_obj
-        else None,
+        package_config=package_config_obj,
         job_config=job_config_obj,
         event=event,
     )
@@ -126,12 +319,9 @@ def run_source_git_pr_to_dist_git_pr_handler(
 def run_gitlab_ci_to_source_git_pr_handler(
     event: dict, package_config: dict, job_config: dict
 ):
-    job_config_obj = load_job_config(job_config)
-    packages_config_obj = load_package_config(package_config)
+    package_config_obj, job_config_obj = load_configs(package_config, job_config)
     handler = GitlabCIToSourceGitPRHandler(
-        package_config=packages_config_obj.get_package_config_for(job_config_obj)
-        if packages_config_obj
-        else None,
+        package_config=package_config_obj,
         job_config=job_config_obj,
         event=event,
     )
@@ -142,12 +332,9 @@ def run_gitlab_ci_to_source_git_pr_handler(
 def run_pagure_ci_to_source_git_pr_handler(
     event: dict, package_config: dict, job_config: dict
 ):
-    job_config_obj = load_job_config(job_config)
-    packages_config_obj = load_package_config(package_config)
+    package_config_obj, job_config_obj = load_configs(package_config, job_config)
     handler = PagureCIToSourceGitPRHandler(
-        package_config=packages_config_obj.get_package_config_for(job_config_obj)
-        if packages_config_obj
-        else None,
+        package_config=package_config_obj,
         job_config=job_config_obj,
         event=event,
     )
@@ -158,18 +345,47 @@ def run_pagure_ci_to_source_git_pr_handler(
 def run_dist_git_to_source_git_pr_handler(
     event: dict, package_config: dict, job_config: dict
 ):
-    job_config_obj = load_job_config(job_config)
-    packages_config_obj = load_package_config(package_config)
+    package_config_obj, job_config_obj = load_configs(package_config, job_config)
     handler = DistGitToSourceGitPRHandler(
-        package_config=packages_config_obj.get_package_config_for(job_config_obj)
-        if packages_config_obj
-        else None,
+        package_config=package_config_obj,
         job_config=job_config_obj,
         event=event,
     )
     return get_handlers_task_results(handler.run_job(), event)
 
 
+# Deserialized configs, keyed by a hash of their serialized form
+_configs_cache = LRUCache(maxsize=CONFIGS_CACHE_SIZE)
+
+
+def load_configs(
+    package_config: Optional[dict], job_config: Optional[dict]
+) -> Tuple[Optional[PackageConfig], Optional[JobConfig]]:
+    """
+    Deserialize the configs a handler task has been sent.
+
+    The same configs are sent over and over again, so the (schema) loading
+    is memoized. The returned objects are shared by the tasks of the worker,
+    the handlers copy them on access, see SharedConfigsMixin.
+
+    Returns:
+        package config of the job & the job config
+    """
+    serialized = json.dumps([package_config, job_config], sort_keys=True, default=str)
+    key = sha256(serialized.encode()).hexdigest()
+    if (configs := _configs_cache.get(key)) is None:
+        job_config_obj = load_job_config(job_config)
+        packages_config_obj = load_package_config(package_config)
+        configs = (
+            packages_config_obj.get_package_config_for(job_config_obj)
+            if packages_config_obj
+            else None,
+            job_config_obj,
+        )
+        _configs_cache.set(key, configs)
+    return configs
+
+
 def get_handlers_task_results(results: dict, event: dict) -> dict:
     # include original event to provide more info
     return {"job": results, "event": event}
@@ -3,9 +3,11 @@
 import pytest
 from flexmock import flexmock
 
+from hardly.db import PullRequestsRepository
+from hardly.handlers import distgitCI_to_sourcegitPR
 from hardly.jobs import StreamJobs
+from hardly.store import VersionedState
 from packit_service.config import ServiceConfig
-from packit_service.models import SourceGitPRDistGitPRModel
 from packit_service.worker.parser import Parser
 from packit_service.worker.reporting import (
     BaseCommitStatus,
@@ -49,25 +51,24 @@ def test_sync_from_dist_git(
     event = Parser.parse_event(request.getfixturevalue(event))
     handler = StreamJobs(event).get_handlers_for_event().pop()
 
-    dist_git_pr_model = flexmock(id=2)
-    flexmock(handler).should_receive("dist_git_pr_model").and_return(dist_git_pr_model)
-
     source_git_pr = flexmock(id=123, head_commit="foobar")
     source_git_project = flexmock(
         project_url=src_project_url,
         get_pr=source_git_pr,
     )
-    source_git_pr_model = flexmock(pr_id=123, project=source_git_project)
-    source_git_pr_dist_git_pr_model = flexmock(
-        source_git_pull_request=source_git_pr_model
-    )
-    flexmock(SourceGitPRDistGitPRModel).should_receive("get_by_dist_git_id").with_args(
-        2
-    ).and_return(source_git_pr_dist_git_pr_model)
+    flexmock(PullRequestsRepository).should_receive("get_source_git_pr_ref").with_args(
+        str, int
+    ).and_return((src_project_url, 123))
+    # not recorded yet, taken from the MR
+    flexmock(PullRequestsRepository).should_receive("get_head_commit").and_return(None)
+    flexmock(VersionedState).should_receive("set_if_newer").with_args(
+        tuple, status_state.value
+    ).and_return(True)
     flexmock(ServiceConfig).should_receive("get_project").with_args(
         url=src_project_url
     ).and_return(source_git_project)
 
+    flexmock(distgitCI_to_sourcegitPR).should_receive("throttle")
     status_reporter = flexmock()
     status_reporter.should_receive("set_status").with_args(
         state=status_state,
@@ -5,10 +5,12 @@ import os
 import pytest
 from flexmock import flexmock
 
+from hardly.cache import BranchesCache, MissingProjectsCache
+from hardly.handlers import distgit_to_sourcegitPR
 from hardly.jobs import StreamJobs
 from ogr.abstract import GitProject
 from packit.api import PackitAPI
-from packit.local_project import LocalProject
+from packit.local_project import LocalProject, LocalProjectBuilder
 from packit_service.config import ServiceConfig
 from packit_service.constants import SANDCASTLE_WORK_DIR
 from packit_service.worker.parser import Parser
@@ -65,8 +67,13 @@ def test_distgit_to_sourcegit_pr(
     # sc.should_receive("get_project").with_args(url=dist_git_project_url).once()
     # sc.should_receive("get_project").with_args(url=src_project_url).once()
 
+    flexmock(MissingProjectsCache).should_receive("is_missing").with_args(
+        src_project_url + ".git"
+    ).and_return(False)
     flexmock(GitProject).should_receive("exists").and_return(True)
+    flexmock(BranchesCache).should_receive("branch_exists").and_return(True)
 
+    flexmock(distgit_to_sourcegitPR).should_receive("throttle")
     flexmock(PackitAPI).should_receive("sync_push")
 
     handler(
@@ -74,3 +81,20 @@ def test_distgit_to_sourcegit_pr(
         job_config=None,
         event=event.get_dict(),
     ).run()
+
+
+def test_distgit_to_sourcegit_pr_no_branch(gitlab_push_event):
+    event = Parser.parse_event(gitlab_push_event)
+    handler = StreamJobs(event).get_handlers_for_event().pop()
+    flexmock(MissingProjectsCache).should_receive("is_missing").and_return(False)
+    flexmock(GitProject).should_receive("exists").and_return(True)
+    flexmock(BranchesCache).should_receive("branch_exists").and_return(False).once()
+    # the source-git repo is not cloned for nothing
+    flexmock(LocalProjectBuilder).should_receive("build").never()
+    flexmock(PackitAPI).should_receive("sync_push").never()
+
+    assert handler(
+        package_config=None,
+        job_config=None,
+        event=event.get_dict(),
+    ).run()["success"]
@@ -1,8 +1,13 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
+from contextlib import nullcontext
+
 import pytest
 from flexmock import flexmock
 
+from hardly.cache import BranchesCache, MRMappingCache
+from hardly.db import PullRequestsRepository
+from hardly.handlers import SourceGitPRToDistGitPRHandler, sourcegitPR_to_distgitPR
 from hardly.tasks import run_source_git_pr_to_dist_git_pr_handler
 from ogr.services.gitlab import GitlabProject, GitlabPullRequest
 from ogr.services.pagure import PagureProject
@@ -14,7 +19,6 @@ from packit_service.config import ServiceConfig
 from packit_service.constants import SANDCASTLE_WORK_DIR
 from packit_service.models import (
     PullRequestModel,
-    SourceGitPRDistGitPRModel,
     ProjectEventModel,
     ProjectEventModelType,
 )
@@ -89,19 +93,33 @@ def test_source_git_pr_to_dist_git_pr(mr_event, dist_git_branches, target_repo_b
     )
 
     flexmock(ProjectEventModel).should_receive("get_or_create").and_return(flexmock())
-    flexmock(SourceGitPRDistGitPRModel).should_receive(
-        "get_by_source_git_id"
-    ).and_return(None)
+    flexmock(PullRequestsRepository).should_receive("get_dist_git_pr").and_return(None)
 
-    lp = flexmock(
+    flexmock(
         LocalProject,
         refresh_the_arguments=lambda: None,
         checkout_ref=lambda ref: None,
     )
-    lp.should_receive("fetch").with_args(
-        "https://gitlab.com/packit-service/src/open-vm-tools", force=True
+    flexmock(SourceGitPRToDistGitPRHandler).should_receive("fetch_upstream_refs")
+    flexmock(sourcegitPR_to_distgitPR).should_receive("throttle")
+    flexmock(MRMappingCache).should_receive("set_head_commit").with_args(
+        "https://gitlab.com/packit-service/src/open-vm-tools", 5, str, timestamp=int
+    ).once()
+    flexmock(sourcegitPR_to_distgitPR).should_receive("lease").with_args(
+        "mr-sync",
+        "https://gitlab.com/packit-service/src/open-vm-tools/-/merge_requests/5",
+        ttl=int,
+        wait=int,
+    ).and_return(nullcontext(True)).times(
+        # a MR with no matching dist-git branch is rejected before taking the lock
+        1
+        if target_repo_branch in dist_git_branches
+        else 0
     )
     flexmock(PagureProject).should_receive("get_branches").and_return(dist_git_branches)
+    flexmock(BranchesCache).should_receive("branch_exists").replace_with(
+        lambda project, branch: branch in project.get_branches()
+    )
     flexmock(Upstream).should_receive("get_specfile_version").and_return(version)
 
     config = ServiceConfig()
@@ -112,8 +130,8 @@ def test_source_git_pr_to_dist_git_pr(mr_event, dist_git_branches, target_repo_b
     flexmock(Pushgateway).should_receive("push").once().and_return()
     flexmock(GitlabPullRequest).should_receive("comment").and_return()
     if target_repo_branch in dist_git_branches:
-        flexmock(SourceGitPRDistGitPRModel).should_receive("get_by_dist_git_id")
-        flexmock(SourceGitPRDistGitPRModel).should_receive("get_or_create")
+        flexmock(PullRequestsRepository).should_receive("get_source_git_pr")
+        flexmock(PullRequestsRepository).should_receive("link").once()
         (
             flexmock(PackitAPI)
             .should_receive("sync_release")
@@ -0,0 +1,117 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from flexmock import flexmock
+
+from hardly import cache
+from hardly.cache import (
+    BranchesCache,
+    LRUCache,
+    MissingProjectsCache,
+    PackageConfigCache,
+)
+
+PROJECT_URL = "https://gitlab.com/redhat/centos-stream/src/make"
+KEY = f"hardly:branches:{PROJECT_URL}"
+
+
+def mock_redis(cached, exists):
+    pipe = flexmock(exists=lambda key: None, sismember=lambda key, branch: None)
+    pipe.should_receive("execute").and_return([cached, exists])
+    pipe.should_receive("__enter__").and_return(pipe)
+    pipe.should_receive("__exit__")
+    redis = flexmock(pipeline=lambda: pipe)
+    flexmock(cache).should_receive("get_redis").and_return(redis)
+    return pipe
+
+
+@pytest.mark.parametrize("branch, exists", [("c9s", True), ("c8s", False)])
+def test_branch_exists_cached(branch, exists):
+    mock_redis(cached=True, exists=exists)
+    project = flexmock(
+        service=flexmock(instance_url="https://gitlab.com"),
+        namespace="redhat/centos-stream/src",
+        repo="make",
+    )
+    project.should_receive("get_branches").never()
+
+    assert BranchesCache.branch_exists(project, branch) == exists
+
+
+def test_branch_exists_not_cached():
+    pipe = mock_redis(cached=False, exists=False)
+    pipe.should_receive("sadd").with_args(KEY, "", "c9s", "main").once()
+    pipe.should_receive("expire").with_args(KEY, int).once()
+    project = flexmock(
+        service=flexmock(instance_url="https://gitlab.com"),
+        namespace="redhat/centos-stream/src",
+        repo="make",
+    )
+    project.should_receive("get_branches").and_return(["c9s", "main"]).once()
+
+    assert BranchesCache.branch_exists(project, "c9s")
+
+
+@pytest.mark.parametrize(
+    "branch, known, invalidated",
+    [
+        pytest.param("c9s", True, False, id="push to existing branch"),
+        pytest.param("c10s", False, True, id="new branch"),
+    ],
+)
+def test_update_on_push(branch, known, invalidated):
+    redis = flexmock(sismember=lambda key, branch: known)
+    redis.should_receive("delete").with_args(KEY).times(1 if invalidated else 0)
+    flexmock(cache).should_receive("get_redis").and_return(redis)
+
+    BranchesCache.update_on_push(f"{PROJECT_URL}.git", branch)
+
+
+def test_missing_projects_refresh_one():
+    redis = flexmock()
+    redis.should_receive("delete").with_args(
+        f"hardly:missing-project:{PROJECT_URL}"
+    ).and_return(1)
+    flexmock(cache).should_receive("get_redis").and_return(redis)
+
+    assert MissingProjectsCache.refresh(f"{PROJECT_URL}.git") == 1
+
+
+def test_missing_projects_refresh_all():
+    keys = ["hardly:missing-project:a", "hardly:missing-project:b"]
+    redis = flexmock()
+    redis.should_receive("scan_iter").with_args(
+        match="hardly:missing-project:*"
+    ).and_return(iter(keys))
+    redis.should_receive("delete").with_args(*keys).and_return(2)
+    flexmock(cache).should_receive("get_redis").and_return(redis)
+
+    assert MissingProjectsCache.refresh() == 2
+
+
+def test_lru_cache():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1
+    lru.set("c", 3)
+
+    assert len(lru) == 2
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert lru.get("c") == 3
+
+
+def test_package_config_cache_local(monkeypatch):
+    monkeypatch.delenv("PACKAGE_CONFIG_CACHE_SHARED", raising=False)
+    flexmock(cache).should_receive("get_redis").never()
+    flexmock(PackageConfigCache, _local=LRUCache(maxsize=1))
+    package_config = {"downstream_package_name": "make"}
+
+    PackageConfigCache.set(f"{PROJECT_URL}.git", "abcd", package_config)
+    cached = PackageConfigCache.get(PROJECT_URL, "abcd")
+
+    assert cached == package_config
+    assert cached is not package_config
+    assert PackageConfigCache.get(PROJECT_URL, "efgh") is None
@@ -0,0 +1,114 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+import requests
+from flexmock import flexmock
+
+from hardly import circuit_breaker
+from hardly.circuit_breaker import (
+    CircuitBreaker,
+    Permit,
+    forget_failed_responses,
+    get_failing_host,
+    observe_response,
+)
+
+
+def mock_redis(*results, probe_acquired=False):
+    pipe = flexmock(
+        exists=lambda key: None,
+        set=lambda *args, **kwargs: None,
+        delete=lambda *keys: None,
+        hincrby=lambda key, field, amount: None,
+        expire=lambda key, ttl: None,
+        hgetall=lambda key: None,
+    )
+    pipe.should_receive("execute").and_return(*results)
+    pipe.should_receive("__enter__").and_return(pipe)
+    pipe.should_receive("__exit__")
+    redis = flexmock(pipeline=lambda: pipe)
+    redis.should_receive("set").and_return(probe_acquired)
+    flexmock(circuit_breaker).should_receive("get_redis").and_return(redis)
+    return pipe
+
+
+@pytest.mark.parametrize(
+    "tripped, is_open, probe_acquired, permit",
+    [
+        pytest.param(0, 0, False, Permit.allowed, id="closed"),
+        pytest.param(1, 1, False, Permit.denied, id="open"),
+        pytest.param(1, 0, True, Permit.probe, id="half-open, probe"),
+        pytest.param(1, 0, False, Permit.denied, id="half-open, probe running"),
+    ],
+)
+def test_allow(tripped, is_open, probe_acquired, permit):
+    mock_redis([tripped, is_open], probe_acquired=probe_acquired)
+
+    assert CircuitBreaker("gitlab.com").allow() == permit
+
+
+@pytest.mark.parametrize(
+    "previous, current, tripped, trips",
+    [
+        pytest.param({}, {"ok": "8", "error": "1"}, 0, False, id="too few calls"),
+        pytest.param(
+            {"ok": "5"}, {"ok": "1", "error": "4"}, 0, False, id="low error rate"
+        ),
+        pytest.param(
+            {"error": "3"}, {"ok": "3", "error": "4"}, 0, True, id="high error rate"
+        ),
+        pytest.param(
+            {"error": "3"}, {"ok": "3", "error": "4"}, 1, False, id="already tripped"
+        ),
+    ],
+)
+def test_record_failure(previous, current, tripped, trips):
+    mock_redis([1, True, previous, current, tripped])
+    breaker = CircuitBreaker("gitlab.com")
+    flexmock(breaker).should_receive("_trip").times(1 if trips else 0)
+
+    breaker.record(success=False, permit=Permit.allowed)
+
+
+@pytest.mark.parametrize("success", [True, False])
+def test_record_probe(success):
+    breaker = CircuitBreaker("gitlab.com")
+    flexmock(breaker).should_receive("_close").times(1 if success else 0)
+    flexmock(breaker).should_receive("_trip").times(0 if success else 1)
+
+    breaker.record(success=success, permit=Permit.probe)
+
+
+def test_for_event():
+    assert (
+        CircuitBreaker.for_event(
+            {"project_url": "https://src.fedoraproject.org/rpms/make"}
+        ).host
+        == "src.fedoraproject.org"
+    )
+    assert CircuitBreaker.for_event({"project_url": None}) is None
+
+
+def test_get_failing_host():
+    request = requests.Request("GET", "https://gitlab.com/api/v4/projects/1").prepare()
+    try:
+        try:
+            raise requests.ConnectionError(request=request)
+        except requests.ConnectionError as ex:
+            raise RuntimeError("Failed to get the project") from ex
+    except RuntimeError as ex:
+        assert get_failing_host(ex) == "gitlab.com"
+
+
+def test_get_failing_host_from_response():
+    response = requests.Response()
+    response.status_code = 503
+    response.url = "https://src.fedoraproject.org/api/0/rpms/make"
+    forget_failed_responses()
+    observe_response(response)
+
+    # API errors don't carry the URL
+    assert get_failing_host(RuntimeError("503")) == "src.fedoraproject.org"
+    forget_failed_responses()
+    assert get_failing_host(RuntimeError("503")) is None
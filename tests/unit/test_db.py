@@ -0,0 +1,157 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+from contextlib import contextmanager
+
+import pytest
+from flexmock import flexmock
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Query, Session
+
+from hardly import db
+from hardly.cache import MRMappingCache
+from hardly.db import PullRequestsRepository
+from packit_service.models import (
+    GitProjectModel,
+    ProjectEventModel,
+    PullRequestModel,
+    SourceGitPRDistGitPRModel,
+)
+
+PROJECT_URL = "https://gitlab.com/redhat/centos-stream/src/make"
+
+
+@pytest.fixture()
+def sqlite_session():
+    engine = create_engine("sqlite://")
+    SourceGitPRDistGitPRModel.__table__.create(engine)
+    with Session(engine) as session:
+
+        @contextmanager
+        def transaction(commit: bool = False):
+            yield session
+            if commit:
+                session.commit()
+
+        flexmock(db).should_receive("sa_session_transaction").replace_with(transaction)
+        yield session
+
+
+def test_get_pr_identity_mapped(sqlite_session):
+    project = flexmock(id=3)
+    pr = flexmock(id=1, project_event_model_type="pull_request")
+    flexmock(PullRequestsRepository).should_receive("_get_or_insert").with_args(
+        sqlite_session,
+        GitProjectModel,
+        defaults={"instance_url": "gitlab.com"},
+        namespace="redhat/centos-stream/src",
+        repo_name="make",
+        project_url=PROJECT_URL,
+    ).and_return(project).once()
+    flexmock(PullRequestsRepository).should_receive("_get_or_insert").with_args(
+        sqlite_session, PullRequestModel, pr_id=5, project_id=3
+    ).and_return(pr).once()
+    flexmock(PullRequestsRepository).should_receive("_get_or_insert").with_args(
+        sqlite_session,
+        ProjectEventModel,
+        type="pull_request",
+        event_id=1,
+        commit_sha="abcd",
+    ).once()
+    repository = PullRequestsRepository()
+
+    for _ in range(2):
+        assert (
+            repository.get_pr(
+                project_url=PROJECT_URL,
+                pr_id="5",
+                namespace="redhat/centos-stream/src",
+                repo_name="make",
+                commit_sha="abcd",
+            )
+            is pr
+        )
+
+
+def test_get_or_insert_inserted_concurrently(sqlite_session, monkeypatch):
+    values = {"source_git_pull_request_id": 1, "dist_git_pull_request_id": 2}
+    first = Query.first
+
+    def first_after_concurrent_insert(query):
+        # another task inserts the row right after this one hasn't found it
+        monkeypatch.setattr(Query, "first", first)
+        sqlite_session.execute(
+            SourceGitPRDistGitPRModel.__table__.insert().values(**values)
+        )
+        return None
+
+    monkeypatch.setattr(Query, "first", first_after_concurrent_insert)
+
+    row = PullRequestsRepository._get_or_insert(
+        sqlite_session, SourceGitPRDistGitPRModel, **values
+    )
+
+    assert (row.source_git_pull_request_id, row.dist_git_pull_request_id) == (1, 2)
+    assert sqlite_session.query(SourceGitPRDistGitPRModel).count() == 1
+
+
+def test_link_upsert(sqlite_session):
+    source_git_pr = flexmock(id=1, pr_id=5, project=flexmock(project_url=PROJECT_URL))
+    dist_git_pr = flexmock(
+        id=2, pr_id=7, project=flexmock(project_url="https://gitlab.com/rpms/make")
+    )
+    flexmock(MRMappingCache).should_receive("set").once()
+
+    assert PullRequestsRepository.link(source_git_pr, dist_git_pr)
+    assert not PullRequestsRepository.link(source_git_pr, dist_git_pr)
+    assert sqlite_session.query(SourceGitPRDistGitPRModel).count() == 1
+
+
+def test_get_source_git_pr_ref_cached():
+    flexmock(MRMappingCache).should_receive("get_source_git_pr").and_return(
+        (PROJECT_URL, 5)
+    )
+    flexmock(PullRequestsRepository).should_receive("get_source_git_pr").never()
+
+    assert PullRequestsRepository().get_source_git_pr_ref(
+        "https://gitlab.com/redhat/centos-stream/rpms/make", 7
+    ) == (PROJECT_URL, 5)
+
+
+def test_get_source_git_pr_ref_not_cached():
+    dist_git_url = "https://gitlab.com/redhat/centos-stream/rpms/make"
+    flexmock(MRMappingCache).should_receive("get_source_git_pr").and_return(None)
+    flexmock(PullRequestsRepository).should_receive("get_source_git_pr").with_args(
+        dist_git_url, 7
+    ).and_return(flexmock(pr_id=5, project=flexmock(project_url=PROJECT_URL)))
+    flexmock(MRMappingCache).should_receive("set").with_args(
+        source_git=(PROJECT_URL, 5), dist_git=(dist_git_url, 7)
+    ).once()
+
+    assert PullRequestsRepository().get_source_git_pr_ref(dist_git_url, 7) == (
+        PROJECT_URL,
+        5,
+    )
+
+
+@pytest.mark.parametrize(
+    "cached, recorded, head_commit",
+    [
+        pytest.param("abcd", None, "abcd", id="cached"),
+        pytest.param(None, "efgh", "efgh", id="recorded in DB"),
+        pytest.param(None, None, None, id="not recorded"),
+    ],
+)
+def test_get_head_commit(cached, recorded, head_commit):
+    flexmock(MRMappingCache).should_receive("get_head_commit").with_args(
+        PROJECT_URL, 5
+    ).and_return(cached)
+    flexmock(PullRequestsRepository).should_receive(
+        "_get_recorded_head_commit"
+    ).and_return(recorded).times(0 if cached else 1)
+    # refill the cache with the lowest version, not to override any MR event
+    flexmock(MRMappingCache).should_receive("set_head_commit").with_args(
+        PROJECT_URL, 5, recorded, timestamp=0
+    ).times(1 if recorded else 0)
+
+    assert PullRequestsRepository().get_head_commit(PROJECT_URL, 5) == head_commit
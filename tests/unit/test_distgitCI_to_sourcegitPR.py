@@ -0,0 +1,136 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from celery.canvas import Signature
+from flexmock import flexmock
+
+from hardly.handlers import distgitCI_to_sourcegitPR
+from hardly.handlers.distgitCI_to_sourcegitPR import (
+    GitlabCIToSourceGitPRHandler,
+    PagureCIToSourceGitPRHandler,
+)
+from hardly.store import VersionedState
+from packit_service.worker.handlers.abstract import JobHandler
+from packit_service.worker.reporting import BaseCommitStatus
+
+PIPELINE_KEY = "https://gitlab.com/packit-service/rpms/open-vm-tools/-/pipelines/1"
+
+
+@pytest.mark.parametrize(
+    "status, terminal_seen, generation",
+    [
+        pytest.param("running", False, 3, id="running"),
+        pytest.param("running", True, None, id="running after a terminal state"),
+        pytest.param("success", True, 3, id="terminal state"),
+        pytest.param("unknown", False, 3, id="unknown state"),
+    ],
+)
+def test_coalescing_get_signature(status, terminal_seen, generation):
+    event = {
+        "project_url": "https://gitlab.com/packit-service/rpms/open-vm-tools",
+        "pipeline_id": 1,
+        "status": status,
+    }
+    flexmock(JobHandler).should_receive("get_signature").and_return(
+        Signature("task", kwargs={"event": event})
+    )
+    redis = flexmock(exists=lambda key: terminal_seen)
+    redis.should_receive("set").with_args(
+        f"hardly:ci-status-terminal:{PIPELINE_KEY}", 1, ex=int
+    ).times(1 if status == "success" else 0)
+    flexmock(distgitCI_to_sourcegitPR).should_receive("get_redis").and_return(redis)
+    flexmock(distgitCI_to_sourcegitPR.Generation).should_receive("bump").and_return(3)
+
+    signature = GitlabCIToSourceGitPRHandler.get_signature(event=flexmock(), job=None)
+
+    if generation is None:
+        assert signature is None
+    else:
+        assert signature.kwargs["event"]["coalescing_generation"] == generation
+        assert signature.options["countdown"] == 5
+
+
+def test_pagure_coalescing_key_per_commit():
+    event = {
+        "project_url": "https://src.fedoraproject.org/rpms/python-ogr",
+        "pr_id": 2,
+        "username": "Zuul",
+        "commit_sha": "d0143f413982f696550bddfda1a0e0cb8466c855",
+    }
+    new_run = dict(event, commit_sha="0f6a5ab1ca2e3c5d27c8bc1b3c1d6c4b0b8c7f6e")
+
+    assert PagureCIToSourceGitPRHandler.coalescing_key(
+        event
+    ) != PagureCIToSourceGitPRHandler.coalescing_key(new_run)
+
+
+@pytest.mark.parametrize(
+    "generation, current, coalesced",
+    [
+        pytest.param(None, 3, False, id="not coalesced"),
+        pytest.param(3, 3, False, id="latest state"),
+        pytest.param(2, 3, True, id="newer state exists"),
+        pytest.param(0, 3, True, id="after a terminal state"),
+    ],
+)
+def test_is_coalesced(generation, current, coalesced):
+    event_dict = {
+        "project_url": "https://gitlab.com/packit-service/rpms/open-vm-tools",
+        "pipeline_id": 1,
+    }
+    if generation is not None:
+        event_dict["coalescing_generation"] = generation
+    handler = flexmock(
+        data=flexmock(event_dict=event_dict),
+        coalescing_key=GitlabCIToSourceGitPRHandler.coalescing_key,
+    )
+    flexmock(distgitCI_to_sourcegitPR.Generation).should_receive("current").and_return(
+        current
+    )
+
+    assert GitlabCIToSourceGitPRHandler.is_coalesced(handler) == coalesced
+
+
+@pytest.mark.parametrize(
+    "event_dict, status_state, version",
+    [
+        pytest.param(
+            {"created_at": 1650000000},
+            BaseCommitStatus.running,
+            (1650000000, 1),
+            id="GitLab pipeline",
+        ),
+        pytest.param(
+            {"created_at": 1650000000, "date_updated": 1640000000},
+            BaseCommitStatus.success,
+            (1640000000, 2),
+            id="Pagure flag",
+        ),
+    ],
+)
+def test_status_version(event_dict, status_state, version):
+    handler = flexmock(data=flexmock(event_dict=event_dict), status_state=status_state)
+    assert GitlabCIToSourceGitPRHandler.status_version(handler) == version
+
+
+def test_run_stale_status_not_reported():
+    flexmock(VersionedState).should_receive("set_if_newer").and_return(False)
+    forge_cache = flexmock()
+    forge_cache.should_receive("get_project").never()
+    handler = flexmock(
+        is_coalesced=lambda: False,
+        dist_git_pr_key=lambda: ("https://gitlab.com/rpms/make", 2),
+        db=flexmock(
+            get_source_git_pr_ref=lambda url, pr_id: (
+                "https://gitlab.com/src/make",
+                123,
+            )
+        ),
+        status_check_name="Dist-git MR CI Pipeline",
+        status_state=BaseCommitStatus.running,
+        status_version=lambda: (1650000000, 1),
+        forge_cache=forge_cache,
+    )
+
+    assert GitlabCIToSourceGitPRHandler.run(handler)["success"]
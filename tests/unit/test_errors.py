@@ -0,0 +1,64 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import gitlab
+import pytest
+import requests
+from git import GitCommandError
+
+from hardly.errors import is_transient_error
+from ogr.exceptions import (
+    GitForgeInternalError,
+    GitlabAPIException,
+    PagureAPIException,
+)
+
+
+def gitlab_api_exception(response_code: int) -> GitlabAPIException:
+    try:
+        try:
+            raise gitlab.GitlabError("error", response_code=response_code)
+        except gitlab.GitlabError as ex:
+            raise GitlabAPIException("API call failed") from ex
+    except GitlabAPIException as ex:
+        return ex
+
+
+def raised_from(ex: Exception, cause: Exception) -> Exception:
+    ex.__cause__ = cause
+    return ex
+
+
+@pytest.mark.parametrize(
+    "ex, transient",
+    [
+        pytest.param(requests.ConnectionError(), True, id="connection error"),
+        pytest.param(requests.ReadTimeout(), True, id="timeout"),
+        pytest.param(GitForgeInternalError(), True, id="forge internal error"),
+        pytest.param(gitlab_api_exception(502), True, id="5xx"),
+        pytest.param(gitlab_api_exception(429), True, id="rate limit"),
+        pytest.param(gitlab_api_exception(404), False, id="4xx"),
+        pytest.param(PagureAPIException(response_code=503), True, id="Pagure 5xx"),
+        pytest.param(PagureAPIException(), False, id="no response code"),
+        pytest.param(
+            GitCommandError(
+                "git fetch", 128, stderr="fatal: Could not resolve host: gitlab.com"
+            ),
+            True,
+            id="git network error",
+        ),
+        pytest.param(
+            GitCommandError("git checkout", 1, stderr="error: pathspec 'c9s'"),
+            False,
+            id="git error",
+        ),
+        pytest.param(KeyError("canceled"), False, id="unknown status"),
+        pytest.param(
+            raised_from(RuntimeError("sync failed"), requests.ConnectionError()),
+            True,
+            id="caused by connection error",
+        ),
+    ],
+)
+def test_is_transient_error(ex, transient):
+    assert is_transient_error(ex) == transient
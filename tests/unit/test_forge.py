@@ -0,0 +1,86 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+from threading import Event
+
+import pytest
+import requests
+from flexmock import flexmock
+
+from hardly import forge
+from hardly.forge import ForgeObjectsCache, SessionsSetup, warm_up
+from hardly.monitoring import forge_cache_lookups
+
+
+def test_get_project():
+    project = flexmock()
+    service_config = flexmock()
+    service_config.should_receive("get_project").with_args(
+        url="https://gitlab.com/redhat/centos-stream/src/make.git"
+    ).and_return(project).once()
+    cache = ForgeObjectsCache(service_config)
+    hits = forge_cache_lookups.labels(kind="project", result="hit")._value.get()
+
+    assert (
+        cache.get_project("https://gitlab.com/redhat/centos-stream/src/make.git")
+        is project
+    )
+    assert (
+        cache.get_project("https://gitlab.com/redhat/centos-stream/src/make") is project
+    )
+    assert (
+        forge_cache_lookups.labels(kind="project", result="hit")._value.get()
+        == hits + 1
+    )
+
+
+def test_get_pr():
+    pr = flexmock()
+    project = flexmock()
+    project.should_receive("get_pr").with_args(5).and_return(pr).once()
+    other_project = flexmock()
+    other_project.should_receive("get_pr").with_args(5).and_return(flexmock()).once()
+    cache = ForgeObjectsCache(flexmock())
+
+    assert cache.get_pr(project, "5") is pr
+    assert cache.get_pr(project, 5) is pr
+    assert cache.get_pr(other_project, 5) is not pr
+
+
+def test_warm_up_unreachable():
+    service = flexmock(instance_url="https://gitlab.com")
+    session = flexmock()
+    session.should_receive("head").and_raise(requests.ConnectionError).once()
+
+    # a forge being down doesn't prevent the worker from starting
+    warm_up(service, session)
+
+
+def test_sessions_setup():
+    services = [flexmock(instance_url="https://gitlab.com"), flexmock()]
+    session = requests.Session()
+    flexmock(forge).should_receive("get_session").and_return(session).and_raise(
+        RuntimeError
+    )
+    flexmock(forge).should_receive("warm_up").with_args(services[0], session).once()
+    configured = []
+
+    setup = SessionsSetup(services, lambda *args: configured.append(args))
+    setup.start()
+    setup.wait(timeout=10)
+
+    assert configured == [(services[0], session)]
+
+
+def test_sessions_setup_abandoned():
+    # e.g. the authentication takes too long
+    authenticated = Event()
+    flexmock(forge).should_receive("get_session").replace_with(
+        lambda service: authenticated.wait() and requests.Session()
+    )
+    setup = SessionsSetup([flexmock()], configure=lambda *args: pytest.fail())
+    setup.start()
+
+    setup.wait(timeout=0)
+    authenticated.set()
+    setup.join()
@@ -0,0 +1,39 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import git
+
+from hardly.git_cache import MirrorRepositoryCache
+
+
+def test_get_repo(tmp_path):
+    upstream = git.Repo.init(tmp_path / "upstream")
+    upstream.index.commit("Initial commit")
+    upstream.create_tag("1.0")
+    cache = MirrorRepositoryCache(tmp_path / "cache", max_size=10 * 1024**2)
+
+    repo = cache.get_repo(str(tmp_path / "upstream"), tmp_path / "clone1")
+    assert repo.remote("origin").url == str(tmp_path / "upstream")
+    assert [tag.name for tag in repo.tags] == ["1.0"]
+
+    upstream.index.commit("Second commit")
+    upstream.create_tag("1.1")
+    repo = cache.get_repo(str(tmp_path / "upstream"), tmp_path / "clone2")
+    assert repo.head.commit.message == "Second commit"
+    assert [tag.name for tag in repo.tags] == ["1.0", "1.1"]
+    assert len(list(cache.cache_path.glob("*.git"))) == 1
+
+
+def test_evict(tmp_path):
+    for name in ("first", "second"):
+        git.Repo.init(tmp_path / name).index.commit("Initial commit")
+    cache = MirrorRepositoryCache(tmp_path / "cache", max_size=1)
+
+    cache.get_repo(str(tmp_path / "first"), tmp_path / "clone1")
+    cache.get_repo(str(tmp_path / "second"), tmp_path / "clone2")
+
+    assert list(cache.cache_path.glob("*.git")) == [
+        cache.mirror_path(str(tmp_path / "second"))
+    ]
+    # the clone doesn't depend on the removed mirror
+    assert git.Repo(tmp_path / "clone1").head.commit.message == "Initial commit"
@@ -0,0 +1,92 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+import requests
+from flexmock import flexmock
+from requests.adapters import HTTPAdapter
+
+from hardly.http_cache import CachedResponse, CachingHTTPAdapter, ResponseCache
+
+URL = "https://gitlab.com/api/v4/projects/1"
+
+
+def response(status_code: int, content: bytes = b"", **headers) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers)
+    return response
+
+
+def get(adapter: CachingHTTPAdapter, token: str = "a") -> requests.Response:
+    request = requests.Request("GET", URL, headers={"PRIVATE-TOKEN": token})
+    return adapter.send(request.prepare())
+
+
+@pytest.fixture()
+def adapter():
+    return CachingHTTPAdapter(ResponseCache(max_size=1024))
+
+
+def test_revalidated(adapter):
+    flexmock(HTTPAdapter).should_receive("send").replace_with(
+        lambda request, **_: response(200, b"project", ETag='"1"')
+        if "If-None-Match" not in request.headers
+        else response(304, **{"RateLimit-Remaining": "99"})
+    ).twice()
+
+    assert get(adapter).content == b"project"
+    revalidated = get(adapter)
+    assert revalidated.status_code == 200
+    assert revalidated.content == b"project"
+    assert revalidated.headers["RateLimit-Remaining"] == "99"
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        pytest.param(
+            response(200, b"old", ETag='"1"'),
+            response(200, b"new", ETag='"2"'),
+            id="modified",
+        ),
+        pytest.param(
+            response(200, b"old"),
+            response(304),
+            id="no validators",
+        ),
+    ],
+)
+def test_not_revalidated(adapter, first, second):
+    flexmock(HTTPAdapter).should_receive("send").and_return(first).and_return(second)
+
+    get(adapter)
+    assert get(adapter) is second
+
+
+def test_keyed_by_account(adapter):
+    requests_sent = []
+    flexmock(HTTPAdapter).should_receive("send").replace_with(
+        lambda request, **_: requests_sent.append(request)
+        or response(200, b"project", ETag='"1"')
+    )
+
+    get(adapter, token="a")
+    get(adapter, token="b")
+    get(adapter, token="a")
+    assert ["If-None-Match" in request.headers for request in requests_sent] == [
+        False,
+        False,
+        True,
+    ]
+
+
+def test_eviction():
+    cache = ResponseCache(max_size=25)
+    for key in ("a", "b", "c"):
+        cache.set(key, CachedResponse(200, {}, b"0123456789", None, "OK"))
+
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.size == 20
@@ -2,6 +2,7 @@
 # SPDX-License-Identifier: MIT
 
 import pytest
+from flexmock import flexmock
 
 from hardly.handlers import (
     DistGitToSourceGitPRHandler,
@@ -9,7 +10,16 @@ from hardly.handlers import (
     PagureCIToSourceGitPRHandler,
     SourceGitPRToDistGitPRHandler,
 )
-from hardly.jobs import StreamJobs
+from hardly.handlers.abstract import (
+    HANDLERS_FOR_EVENT,
+    SUPPORTED_EVENTS_FOR_HANDLER,
+    get_handlers_for_event_class,
+    reacts_to,
+)
+from hardly import jobs
+from hardly.cache import BranchesCache
+from hardly.jobs import ZERO_SHA, StreamJobs
+from packit_service.config import ServiceConfig
 from packit_service.worker.events import (
     MergeRequestGitlabEvent,
     PipelineGitlabEvent,
@@ -59,3 +69,132 @@ def test_get_handlers_for_event(event_cls, expected_handlers):
 
     event = Event()
     assert StreamJobs(event).get_handlers_for_event() == expected_handlers
+
+
+def test_get_handlers_for_event_new_handler_registered():
+    class Event(PushGitlabEvent):
+        def __init__(self):
+            pass
+
+    event = Event()
+    assert StreamJobs(event).get_handlers_for_event() == {DistGitToSourceGitPRHandler}
+
+    @reacts_to(event=PushGitlabEvent)
+    class NewHandler:
+        pass
+
+    try:
+        assert StreamJobs(event).get_handlers_for_event() == {
+            DistGitToSourceGitPRHandler,
+            NewHandler,
+        }
+    finally:
+        SUPPORTED_EVENTS_FOR_HANDLER.pop(NewHandler)
+        HANDLERS_FOR_EVENT[PushGitlabEvent].discard(NewHandler)
+        get_handlers_for_event_class.cache_clear()
+
+
+def test_process_messages():
+    signatures = [flexmock(), flexmock(), flexmock()]
+    flexmock(StreamJobs).should_receive("get_signatures").and_return(
+        signatures[:2]
+    ).and_return([]).and_return(signatures[2:]).times(3)
+    group = flexmock()
+    group.should_receive("apply_async").once()
+    flexmock(jobs).should_receive("group").with_args(signatures).and_return(group)
+
+    assert (
+        StreamJobs().process_messages(
+            [({}, "gitlab", "Push Hook"), ({}, None, None), ({}, None, None)]
+        )
+        == []
+    )
+
+
+def test_process_messages_malformed():
+    signatures = [flexmock(), flexmock()]
+    flexmock(StreamJobs).should_receive("get_signatures").and_return(
+        signatures[:1]
+    ).and_raise(KeyError("status")).and_return(signatures[1:]).times(3)
+    group = flexmock()
+    group.should_receive("apply_async").once()
+    # the malformed message doesn't prevent the others from being sent
+    flexmock(jobs).should_receive("group").with_args(signatures).and_return(group)
+
+    assert (
+        StreamJobs().process_messages(
+            [
+                ({}, "gitlab", "Pipeline Hook"),
+                ({}, "gitlab", "Pipeline Hook"),
+                ({}, None, None),
+            ]
+        )
+        == []
+    )
+
+
+def test_process_messages_nothing_to_send():
+    flexmock(StreamJobs).should_receive("get_signatures").and_return([])
+    flexmock(jobs).should_receive("group").never()
+
+    assert StreamJobs().process_messages([({}, None, None)]) == []
+
+
+@pytest.mark.parametrize(
+    "targets_handled, handled",
+    [
+        pytest.param(None, True, id="no config"),
+        pytest.param(
+            [flexmock(repo="packit-service/src/.+", branch=None)], True, id="handled"
+        ),
+        pytest.param(
+            [flexmock(repo="redhat/centos-stream/src/.+", branch=None)],
+            False,
+            id="not handled",
+        ),
+    ],
+)
+def test_get_signatures_mr_target(mr_event, targets_handled, handled):
+    flexmock(ServiceConfig).should_receive("get_service_config").and_return(
+        flexmock(gitlab_mr_targets_handled=targets_handled)
+    )
+    signature = flexmock()
+    signature.should_receive("set").and_return(signature)
+    flexmock(SourceGitPRToDistGitPRHandler).should_receive("get_signature").and_return(
+        signature
+    ).times(1 if handled else 0)
+
+    assert StreamJobs().get_signatures(mr_event, "gitlab", "Merge Request Hook") == (
+        [signature] if handled else []
+    )
+
+
+@pytest.mark.parametrize(
+    "change, invalidated",
+    [
+        pytest.param({}, False, id="push to a branch"),
+        pytest.param(
+            {"after": ZERO_SHA, "checkout_sha": None, "commits": []},
+            True,
+            id="deleted branch",
+        ),
+        pytest.param(
+            {"before": ZERO_SHA, "commits": [], "total_commits_count": 0},
+            True,
+            id="created branch with no new commits",
+        ),
+    ],
+)
+def test_get_signatures_branch_change(gitlab_push_event, change, invalidated):
+    gitlab_push_event.update(change)
+    flexmock(BranchesCache).should_receive("invalidate").with_args(
+        "https://gitlab.com/packit-service/rpms/open-vm-tools"
+    ).times(1 if invalidated else 0)
+    # a push which gets through the parser, invalidates only unknown branches
+    flexmock(BranchesCache).should_receive("update_on_push").with_args(
+        project_url="https://gitlab.com/packit-service/rpms/open-vm-tools",
+        branch="c9s",
+    ).times(0 if invalidated else 1)
+    flexmock(StreamJobs).should_receive("get_handlers_for_event").and_return(set())
+
+    StreamJobs().get_signatures(gitlab_push_event, "gitlab", "Push Hook")
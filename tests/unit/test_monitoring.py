@@ -0,0 +1,42 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from flexmock import flexmock
+
+from hardly import monitoring
+from hardly.monitoring import MetricsPusher, push_metrics
+
+
+@pytest.mark.parametrize(
+    "process_index, process",
+    [
+        pytest.param(2, "2", id="prefork process"),
+        pytest.param(None, "main", id="main process"),
+    ],
+)
+def test_push_metrics_per_process(monkeypatch, process_index, process):
+    monkeypatch.setenv("PUSHGATEWAY_ADDRESS", "pushgateway:9091")
+    monkeypatch.setenv("HOSTNAME", "hardly-worker-0")
+    flexmock(monitoring).should_receive("current_process_index").and_return(
+        process_index
+    )
+    flexmock(monitoring).should_receive("pushadd_to_gateway").with_args(
+        "pushgateway:9091",
+        job="hardly-worker-0",
+        grouping_key={"process": process},
+        registry=monitoring.registry,
+    ).once()
+
+    push_metrics()
+
+
+def test_metrics_pusher_stop():
+    flexmock(monitoring).should_receive("push_metrics").once()
+    pusher = MetricsPusher(interval=3600)
+    pusher.start()
+
+    pusher.stop()
+    pusher.join(timeout=1)
+
+    assert not pusher.is_alive()
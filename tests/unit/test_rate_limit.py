@@ -0,0 +1,79 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from flexmock import flexmock
+
+from hardly import rate_limit
+from hardly.rate_limit import (
+    OBSERVE_QUOTA,
+    RateLimitExceeded,
+    TokenBucket,
+    get_budgets,
+)
+
+
+@pytest.fixture()
+def budgets(monkeypatch):
+    monkeypatch.setenv(
+        "FORGE_API_RATE_LIMITS", "gitlab.com=10/300, src.fedoraproject.org=2.5/50"
+    )
+    get_budgets.cache_clear()
+    yield
+    get_budgets.cache_clear()
+
+
+def test_budgets(budgets):
+    assert TokenBucket("src.fedoraproject.org", "a").rate == 2.5
+    assert TokenBucket("gitlab.com", "a").burst == 300
+    assert TokenBucket("pagure.io", "a").rate == rate_limit.FORGE_API_RATE
+
+
+def test_for_service():
+    service = flexmock(instance_url="https://gitlab.com", token="secret")
+    key = TokenBucket.for_service(service).key
+
+    assert key.startswith("hardly:api-budget:gitlab.com:")
+    assert "secret" not in key
+
+
+@pytest.mark.parametrize(
+    "wait, sleeps, raises",
+    [
+        pytest.param("0", False, False, id="available"),
+        pytest.param("0.5", True, False, id="wait"),
+        pytest.param("61", False, True, id="exhausted"),
+    ],
+)
+def test_acquire(wait, sleeps, raises):
+    bucket = TokenBucket("gitlab.com", "a")
+    flexmock(bucket).should_receive("_run").and_return(wait)
+    flexmock(rate_limit).should_receive("sleep").with_args(0.5).times(int(sleeps))
+
+    if raises:
+        with pytest.raises(RateLimitExceeded) as ex:
+            bucket.acquire(10, max_wait=60)
+        # deferred until the budget is available
+        assert ex.value.countdown == 61
+    else:
+        bucket.acquire(10, max_wait=60)
+
+
+@pytest.mark.parametrize(
+    "headers, observed",
+    [
+        pytest.param({}, False, id="no quota"),
+        pytest.param(
+            {"RateLimit-Remaining": "5", "RateLimit-Reset": "1700000000"},
+            True,
+            id="GitLab quota",
+        ),
+    ],
+)
+def test_observe_quota(headers, observed):
+    bucket = TokenBucket("gitlab.com", "a")
+    flexmock(bucket).should_receive("_run").with_args(
+        OBSERVE_QUOTA, 5, 1700000000
+    ).times(int(observed))
+
+    bucket.observe_quota(flexmock(headers=headers))
@@ -0,0 +1,81 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+from flexmock import flexmock
+
+from hardly.handlers import GitlabCIToSourceGitPRHandler, SourceGitPRToDistGitPRHandler
+from hardly.routing import HashRing, get_affinity_key, get_affinity_queue, get_queue
+
+PACKAGES = [f"package-{i}" for i in range(1000)]
+
+
+def test_hash_ring_empty():
+    assert HashRing([]).get_node("make") is None
+
+
+def test_hash_ring_distribution():
+    ring = HashRing([f"queue-{i}" for i in range(4)])
+    assignment = [ring.get_node(package) for package in PACKAGES]
+    assert assignment == [ring.get_node(package) for package in PACKAGES]
+    for i in range(4):
+        # each queue gets its share
+        assert assignment.count(f"queue-{i}") > len(PACKAGES) / 8
+
+
+def test_hash_ring_rebalance():
+    before = HashRing([f"queue-{i}" for i in range(4)])
+    after = HashRing([f"queue-{i}" for i in range(5)])
+    moved = [p for p in PACKAGES if before.get_node(p) != after.get_node(p)]
+    # only the packages moved to the new queue
+    assert {after.get_node(package) for package in moved} == {"queue-4"}
+    assert len(moved) < len(PACKAGES) / 3
+
+
+@pytest.mark.parametrize(
+    "project_url, key",
+    [
+        pytest.param("https://gitlab.com/redhat/centos-stream/src/make", "make"),
+        pytest.param(
+            "https://src.fedoraproject.org/rpms/python-httpretty", "python-httpretty"
+        ),
+        pytest.param(None, None),
+    ],
+)
+def test_get_affinity_key(project_url, key):
+    assert get_affinity_key(flexmock(project_url=project_url)) == key
+
+
+def test_get_affinity_queue(monkeypatch):
+    event = flexmock(project_url="https://gitlab.com/redhat/centos-stream/src/make")
+    assert get_affinity_queue(event) is None
+
+    monkeypatch.setenv("AFFINITY_QUEUES", "hardly-0, hardly-1,hardly-2")
+    queue = get_affinity_queue(event)
+    assert queue in ("hardly-0", "hardly-1", "hardly-2")
+    assert get_affinity_queue(event) == queue
+
+
+@pytest.mark.parametrize(
+    "handler_class, affinity_queues, queue",
+    [
+        pytest.param(GitlabCIToSourceGitPRHandler, "", "short-running", id="light"),
+        pytest.param(
+            GitlabCIToSourceGitPRHandler,
+            "hardly-0",
+            "short-running",
+            id="light with affinity",
+        ),
+        pytest.param(SourceGitPRToDistGitPRHandler, "", "long-running", id="heavy"),
+        pytest.param(
+            SourceGitPRToDistGitPRHandler,
+            "hardly-0",
+            "hardly-0",
+            id="heavy with affinity",
+        ),
+    ],
+)
+def test_get_queue(handler_class, affinity_queues, queue, monkeypatch):
+    monkeypatch.setenv("AFFINITY_QUEUES", affinity_queues)
+    event = flexmock(project_url="https://gitlab.com/redhat/centos-stream/src/make")
+    assert get_queue(handler_class, event) == queue
@@ -1,13 +1,21 @@
 # Copyright Contributors to the Packit project.
 # SPDX-License-Identifier: MIT
 
+from contextlib import nullcontext
+
 import pytest
 
 from flexmock import flexmock
+from git import GitCommandError
+from hardly.cache import BranchesCache
+from hardly.errors import Deferred
+from hardly.handlers import sourcegitPR_to_distgitPR
 from hardly.handlers.sourcegitPR_to_distgitPR import (
     SourceGitPRToDistGitPRHandler,
+    SyncSuperseded,
     fix_bz_refs,
 )
+from hardly.store import Generation
 
 
 @pytest.mark.parametrize(
@@ -60,6 +68,20 @@ from hardly.handlers.sourcegitPR_to_distgitPR import (
             False,
             id="multi config, branch mismatch",
         ),
+        pytest.param(
+            [flexmock(repo="redhat/centos-stream/src/make$", branch="c9s")],
+            "redhat/centos-stream/src/make",
+            "c9s",
+            True,
+            id="anchored repo",
+        ),
+        pytest.param(
+            [flexmock(repo="(?i)redhat/centos-stream/src/.+", branch="(?i)C9S")],
+            "RedHat/centos-stream/src/make",
+            "c9s",
+            True,
+            id="inline flags",
+        ),
     ],
 )
 def test_handle_target(targets_handled, target_repo, target_branch, handled):
@@ -102,3 +124,157 @@ This is a Bugzilla: an ugly one.
 Resolves: #1234
 """
     assert fix_bz_refs(inputstr) == outputstr
+
+
+@pytest.mark.parametrize(
+    "upstream_ref, tag",
+    [
+        pytest.param("stable-11.3.0", "stable-11.3.0", id="upstream_ref"),
+        pytest.param(None, "v11.3.0", id="tag from template"),
+    ],
+)
+def test_upstream_refspecs(upstream_ref, tag):
+    up = flexmock(get_specfile_version=lambda: "11.3.0")
+    up.should_receive("convert_version_to_tag").with_args("11.3.0").and_return(
+        "v11.3.0"
+    )
+    mock_mr_handler = flexmock(
+        target_repo_branch="c9s",
+        package_config=flexmock(upstream_ref=upstream_ref),
+        packit_api=flexmock(up=up),
+    )
+    assert SourceGitPRToDistGitPRHandler.upstream_refspecs(mock_mr_handler) == [
+        "+refs/heads/c9s:refs/remotes/upstream/c9s",
+        f"+refs/tags/{tag}:refs/tags/{tag}",
+    ]
+
+
+def test_fetch_upstream_refs_fallback():
+    git_repo = flexmock(git=flexmock())
+    git_repo.git.should_receive("fetch").and_raise(GitCommandError("fetch", 128))
+    local_project = flexmock(git_repo=git_repo)
+    local_project.should_receive("fetch").with_args(
+        "https://gitlab.com/redhat/centos-stream/src/make", force=True
+    ).once()
+    mock_mr_handler = flexmock(
+        project=flexmock(
+            get_web_url=lambda: "https://gitlab.com/redhat/centos-stream/src/make"
+        ),
+        package_config=flexmock(),
+        upstream_refspecs=lambda: ["+refs/tags/4.3:refs/tags/4.3"],
+        _local_project=local_project,
+    )
+    SourceGitPRToDistGitPRHandler.fetch_upstream_refs(mock_mr_handler)
+
+
+@pytest.mark.parametrize(
+    "action, oldrev, code_change",
+    [
+        pytest.param("opened", None, True, id="opened"),
+        pytest.param("update", "abcd", True, id="new commits"),
+        pytest.param("update", None, False, id="description updated"),
+        pytest.param("closed", None, False, id="closed"),
+    ],
+)
+def test_is_code_change(action, oldrev, code_change):
+    event = {"action": action, "oldrev": oldrev}
+    assert SourceGitPRToDistGitPRHandler.is_code_change(event) == code_change
+
+
+@pytest.mark.parametrize(
+    "generation, current, superseded",
+    [
+        pytest.param(None, 3, False, id="no generation"),
+        pytest.param(3, 3, False, id="newest"),
+        pytest.param(2, 3, True, id="superseded"),
+    ],
+)
+def test_check_superseded(generation, current, superseded):
+    event_dict = {
+        "url": "https://gitlab.com/redhat/centos-stream/src/make/-/merge_requests/1"
+    }
+    if generation is not None:
+        event_dict["sync_generation"] = generation
+    mock_mr_handler = flexmock(
+        data=flexmock(event_dict=event_dict),
+        sync_generation=SourceGitPRToDistGitPRHandler.sync_generation,
+        commit_sha="abcd",
+        pr_url=event_dict["url"],
+    )
+    flexmock(Generation).should_receive("current").and_return(current)
+
+    if superseded:
+        with pytest.raises(SyncSuperseded):
+            SourceGitPRToDistGitPRHandler.check_superseded(mock_mr_handler)
+    else:
+        SourceGitPRToDistGitPRHandler.check_superseded(mock_mr_handler)
+
+
+@pytest.mark.parametrize(
+    "package_config, branch_exists, can_be_created",
+    [
+        pytest.param(None, True, False, id="no package config"),
+        pytest.param(
+            flexmock(
+                dist_git_package_url="https://src.fedoraproject.org/rpms/make.git"
+            ),
+            False,
+            False,
+            id="no dist-git branch",
+        ),
+        pytest.param(
+            flexmock(
+                dist_git_package_url="https://src.fedoraproject.org/rpms/make.git"
+            ),
+            True,
+            True,
+            id="can be created",
+        ),
+    ],
+)
+def test_dist_git_pr_can_be_created(package_config, branch_exists, can_be_created):
+    dist_git_project = flexmock()
+    forge_cache = flexmock()
+    forge_cache.should_receive("get_project").with_args(
+        url="https://src.fedoraproject.org/rpms/make.git"
+    ).and_return(dist_git_project)
+    flexmock(BranchesCache).should_receive("branch_exists").with_args(
+        dist_git_project, "c9s"
+    ).and_return(branch_exists)
+    source_git_pr = flexmock()
+    source_git_pr.should_receive("comment").times(
+        1 if package_config and not branch_exists else 0
+    )
+    handler = flexmock(
+        package_config=package_config,
+        forge_cache=forge_cache,
+        target_repo_branch="c9s",
+        target_repo="rpms/make",
+        source_git_pr=source_git_pr,
+    )
+    # nothing is cloned
+    handler.should_receive("packit_api").never()
+
+    assert (
+        SourceGitPRToDistGitPRHandler.dist_git_pr_can_be_created(handler)
+        == can_be_created
+    )
+
+
+def test_run_deferred_when_locked():
+    handler = flexmock(
+        pr_title="Fix make",
+        pr_url="https://gitlab.com/redhat/centos-stream/src/make/-/merge_requests/1",
+        dist_git_pr_model=None,
+    )
+    handler.should_receive("check_superseded")
+    handler.should_receive("handle_target").and_return(True)
+    handler.should_receive("dist_git_pr_can_be_created").and_return(True)
+    handler.should_receive("create_dist_git_pr").never()
+    # another task is syncing (maybe an older commit of) the MR
+    flexmock(sourcegitPR_to_distgitPR).should_receive("lease").and_return(
+        nullcontext(False)
+    )
+
+    with pytest.raises(Deferred):
+        SourceGitPRToDistGitPRHandler._run(handler)
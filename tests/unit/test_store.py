@@ -0,0 +1,36 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+from time import sleep
+
+from flexmock import flexmock
+
+from hardly import store
+from hardly.store import lease
+
+
+def test_lease_renewed():
+    lock = flexmock(name="hardly:lock:mr-sync")
+    lock.should_receive("acquire").and_return(True)
+    lock.should_receive("reacquire").at_least().once()
+    lock.should_receive("release").once()
+    flexmock(store).should_receive("get_redis").and_return(
+        flexmock(lock=lambda *args, **kwargs: lock)
+    )
+
+    with lease("mr-sync", "url", ttl=0.03, wait=0) as locked:
+        assert locked
+        # the sync takes longer than the ttl
+        sleep(0.1)
+
+
+def test_lease_not_acquired():
+    lock = flexmock()
+    lock.should_receive("acquire").and_return(False)
+    lock.should_receive("release").never()
+    flexmock(store).should_receive("get_redis").and_return(
+        flexmock(lock=lambda *args, **kwargs: lock)
+    )
+
+    with lease("mr-sync", "url", ttl=60, wait=0) as locked:
+        assert not locked
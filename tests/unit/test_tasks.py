@@ -0,0 +1,150 @@
+# Copyright Contributors to the Packit project.
+# SPDX-License-Identifier: MIT
+
+import pytest
+import requests
+from celery.exceptions import Ignore
+from flexmock import flexmock
+
+from hardly import tasks
+from hardly.cache import LRUCache
+from hardly.circuit_breaker import CircuitBreaker, Permit
+from hardly.errors import Deferred
+from hardly.handlers.abstract import SharedConfigsMixin
+from hardly.http_cache import CachingHTTPAdapter
+from hardly.monitoring import task_outcomes
+from hardly.rate_limit import RateLimitExceeded
+from hardly.tasks import load_configs
+
+
+def test_load_configs_memoized():
+    flexmock(tasks, _configs_cache=LRUCache(maxsize=2))
+    job_config = {"job": "sync"}
+    packages_config = flexmock()
+    packages_config.should_receive("get_package_config_for").with_args(
+        job_config
+    ).and_return({"downstream_package_name": "make"}).once()
+    flexmock(tasks).should_receive("load_job_config").and_return(job_config).once()
+    flexmock(tasks).should_receive("load_package_config").and_return(
+        packages_config
+    ).once()
+
+    first = load_configs({"a": 1, "b": 2}, {"job": "sync"})
+    # same configs, just serialized in a different order
+    second = load_configs({"b": 2, "a": 1}, {"job": "sync"})
+
+    assert first == second == ({"downstream_package_name": "make"}, job_config)
+    # shared, not copied for each task
+    assert first[0] is second[0]
+
+
+def test_load_configs_not_modified_by_handlers():
+    class Handler(SharedConfigsMixin):
+        def __init__(self, package_config, job_config):
+            self.package_config = package_config
+            self.job_config = job_config
+
+    flexmock(tasks, _configs_cache=LRUCache(maxsize=2))
+    flexmock(tasks).should_receive("load_job_config").and_return({"job": "sync"})
+    flexmock(tasks).should_receive("load_package_config").and_return(
+        flexmock(get_package_config_for=lambda _: {"downstream_package_name": "make"})
+    )
+
+    first = Handler(*load_configs({"a": 1}, {"job": "sync"}))
+    # e.g. PackitAPI sets the downstream package name
+    first.package_config["downstream_package_name"] = "gcc"
+    first.job_config["job"] = "propose_downstream"
+    second = Handler(*load_configs({"a": 1}, {"job": "sync"}))
+
+    assert second.package_config == {"downstream_package_name": "make"}
+    assert second.job_config == {"job": "sync"}
+    assert first.package_config == {"downstream_package_name": "gcc"}
+    # a value set by the handler itself is not copied
+    own = {"downstream_package_name": "bash"}
+    first.package_config = own
+    assert first.package_config is own
+
+
+def test_retry_permanent_error():
+    task = tasks.run_gitlab_ci_to_source_git_pr_handler
+    flexmock(task_outcomes).should_receive("labels").with_args(
+        task=task.name, outcome="failed"
+    ).and_return(flexmock(inc=lambda: None)).once()
+
+    with pytest.raises(KeyError):
+        task.retry(exc=KeyError("canceled"))
+
+
+def test_configure_forge_session():
+    session = requests.Session()
+    service = flexmock(instance_url="https://gitlab.com", token="secret")
+
+    tasks.configure_forge_session(service, session)
+
+    adapter = session.get_adapter("https://gitlab.com")
+    assert isinstance(adapter, CachingHTTPAdapter)
+    assert adapter._pool_maxsize == tasks.FORGE_POOL_SIZE
+    assert len(session.hooks["response"]) == 2
+
+
+@pytest.mark.parametrize(
+    "failing_host, event_host_success",
+    [
+        pytest.param("src.fedoraproject.org", False, id="event's host"),
+        pytest.param("gitlab.com", True, id="other host"),
+    ],
+)
+def test_record_failure(failing_host, event_host_success):
+    breaker = CircuitBreaker("src.fedoraproject.org")
+    error = requests.ConnectionError()
+    recorded = []
+    flexmock(tasks).should_receive("get_failing_host").with_args(error).and_return(
+        failing_host
+    )
+    flexmock(CircuitBreaker).should_receive("record").replace_with(
+        lambda self, success, permit: recorded.append((self.host, success))
+    )
+
+    tasks.HandlerTaskWithRetry._record_failure(breaker, Permit.allowed, error)
+
+    assert recorded[0] == ("src.fedoraproject.org", event_host_success)
+    if failing_host != breaker.host:
+        assert recorded[1] == ("gitlab.com", False)
+
+
+def test_retry_deferred():
+    task = tasks.run_source_git_pr_to_dist_git_pr_handler
+    flexmock(task_outcomes).should_receive("labels").never()
+
+    # deferred by __call__(), not retried
+    with pytest.raises(Deferred):
+        task.retry(exc=Deferred("locked", countdown=60))
+
+
+def test_rate_limit_exceeded_not_a_failure():
+    task = tasks.run_gitlab_ci_to_source_git_pr_handler
+    flexmock(task).should_receive("run").and_raise(
+        RateLimitExceeded("the API budget of gitlab.com is exhausted", countdown=30)
+    )
+    flexmock(CircuitBreaker).should_receive("allow").and_return(Permit.allowed)
+    # an exhausted budget doesn't open the circuit breaker of the forge
+    flexmock(CircuitBreaker).should_receive("record").with_args(
+        success=True, permit=Permit.allowed
+    ).once()
+    flexmock(task).should_receive("retry").never()
+    signature = flexmock()
+    signature.should_receive("apply_async").with_args(countdown=30).once()
+    flexmock(task).should_receive("signature_from_request").and_return(signature)
+
+    task.push_request(called_directly=False)
+    try:
+        with pytest.raises(Ignore):
+            task(
+                event={
+                    "project_url": "https://gitlab.com/redhat/centos-stream/rpms/make"
+                },
+                package_config=None,
+                job_config=None,
+            )
+    finally:
+        task.pop_request()